@@ -32,11 +32,15 @@ class ProfessionalRenderer:
         svg_parts.append(f'''<?xml version="1.0" encoding="UTF-8"?>
 <!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
 <svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" 
-xmlns="http://www.w3.org/2000/svg" version="1.1"
+xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1"
 style="font-family: Arial, sans-serif; background-color: white;">''')
 
-        # Add comprehensive definitions
+        # Add comprehensive definitions, plus the symbols the components reference
+        from professional_symbols import get_symbol_id, render_symbol_defs
         svg_parts.append(self._create_definitions())
+        svg_parts.append(render_symbol_defs(
+            frozenset(get_symbol_id(comp.component_type) for comp in components.values() if not comp.is_instrument)
+        ))
         
         # Add layers in correct order
         svg_parts.append('<g id="grid-layer" opacity="0.3">')
@@ -170,7 +174,7 @@ style="font-family: Arial, sans-serif; background-color: white;">''')
 
     def _render_component(self, component):
         """Render component with professional details"""
-        from professional_symbols import get_component_symbol, create_professional_instrument_bubble
+        from professional_symbols import PROFESSIONAL_ISA_SYMBOLS, get_symbol_id, create_symbol_use, create_professional_instrument_bubble
         
         if component.is_instrument:
             return create_professional_instrument_bubble(
@@ -180,8 +184,8 @@ style="font-family: Arial, sans-serif; background-color: white;">''')
             )
         
         # Get professional symbol
-        symbol = get_component_symbol(component.component_type)
-        if not symbol:
+        symbol_id = get_symbol_id(component.component_type)
+        if symbol_id not in PROFESSIONAL_ISA_SYMBOLS:
             # Fallback to basic shape
             return self._render_basic_component(component)
         
@@ -198,10 +202,8 @@ style="font-family: Arial, sans-serif; background-color: white;">''')
         if component.component_type in ['pump_centrifugal', 'vessel_vertical', 'heat_exchanger']:
             svg += f'<g filter="url(#dropShadow)">'
         
-        # Scale the symbol to fit
-        svg += f'<g transform="scale({component.width/80},{component.height/80})">'
-        svg += symbol
-        svg += '</g>'
+        # Reference the symbol, scaled to fit
+        svg += create_symbol_use(symbol_id, component.width, component.height)
         
         if component.component_type in ['pump_centrifugal', 'vessel_vertical', 'heat_exchanger']:
             svg += '</g>'
@@ -1,19 +1,29 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
 import json
 import datetime
 import re
 import math
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-import ezdxf
-from cairosvg import svg2png
+from packaging import version
 
 # Import professional modules
 
-from professional_symbols import PROFESSIONAL_ISA_SYMBOLS, get_component_symbol, create_professional_instrument_bubble, create_pipe_with_spec, ARROW_MARKERS
+from professional_symbols import PROFESSIONAL_ISA_SYMBOLS, get_symbol_id, create_symbol_use, render_symbol_defs, create_professional_instrument_bubble, create_pipe_with_spec, ARROW_MARKERS
 from advanced_rendering import ProfessionalRenderer, create_suction_filter_system
 from control_systems import ControlSystemAnalyzer, PipeRouter, PnIDValidator
+import geometry_kernels
+
+# Fragments rerun only their own widgets; plain functions on Streamlit without them
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda func: func)
+
+# Streamlit 1.49+ accepts a callable for st.download_button and only fetches the
+# payload on click, instead of hashing and storing it on every rerun
+DEFERRED_DOWNLOADS = version.parse(st.__version__) >= version.parse("1.49.0")
 
 # — CONFIGURATION —
 
@@ -111,34 +121,42 @@ with col2:
         help="Select drawing size"
     )
 
-# Visual Controls with professional defaults
+# Visual Controls with professional defaults. Grouped in a form so adjusting
+# several controls triggers a single rerun on Apply instead of one per widget.
 
-st.sidebar.markdown("### 🎨 Visual Controls")
+with st.sidebar.form("visual_controls"):
+    st.markdown("### 🎨 Visual Controls")
 
-# Use columns for compact layout
+    # Use columns for compact layout
 
-col1, col2 = st.sidebar.columns(2)
-with col1:
-    GRID_VISIBLE = st.checkbox("Show Grid", True)
-    DIMENSIONS_VISIBLE = st.checkbox("Show Dimensions", False)
-with col2:
-    ANNOTATIONS_VISIBLE = st.checkbox("Show Annotations", True)
-    FLOW_ARROWS = st.checkbox("Show Flow Arrows", True)
+    col1, col2 = st.columns(2)
+    with col1:
+        GRID_VISIBLE = st.checkbox("Show Grid", True)
+        DIMENSIONS_VISIBLE = st.checkbox("Show Dimensions", False)
+    with col2:
+        ANNOTATIONS_VISIBLE = st.checkbox("Show Annotations", True)
+        FLOW_ARROWS = st.checkbox("Show Flow Arrows", True)
 
-# Sliders for fine control
+    # Sliders for fine control
 
-GRID_SPACING = st.sidebar.slider("Grid Spacing (mm)", 10, 50, 25, 5)
-SYMBOL_SCALE = st.sidebar.slider("Symbol Scale", 0.5, 2.0, 1.0, 0.1)
+    GRID_SPACING = st.slider("Grid Spacing (mm)", 10, 50, 25, 5)
+    SYMBOL_SCALE = st.slider("Symbol Scale", 0.5, 2.0, 1.0, 0.1)
 
-# Line weights based on standard
+    # Line weights based on standard
 
-st.sidebar.markdown("### 📏 Line Weights")
-line_weight_options = {
-    "Major Process": st.sidebar.slider("Major Process", 2.0, 5.0, 3.0, 0.5),
-    "Minor Process": st.sidebar.slider("Minor Process", 1.5, 3.0, 2.0, 0.5),
-    "Instrument Signal": st.sidebar.slider("Instrument Signal", 0.5, 1.5, 0.7, 0.1),
-    "Electrical": st.sidebar.slider("Electrical", 0.5, 1.5, 0.7, 0.1),
-}
+    st.markdown("### 📏 Line Weights")
+    line_weight_options = {
+        "Major Process": st.slider("Major Process", 2.0, 5.0, 3.0, 0.5),
+        "Minor Process": st.slider("Minor Process", 1.5, 3.0, 2.0, 0.5),
+        "Instrument Signal": st.slider("Instrument Signal", 0.5, 1.5, 0.7, 0.1),
+        "Electrical": st.slider("Electrical", 0.5, 1.5, 0.7, 0.1),
+    }
+
+    st.form_submit_button("Apply", use_container_width=True)
+
+# Submitted visual settings; used verbatim as part of the SVG cache key
+st.session_state.visual_sig = (GRID_VISIBLE, GRID_SPACING, FLOW_ARROWS, ANNOTATIONS_VISIBLE,
+                               tuple(line_weight_options.items()))
 
 # Advanced Features
 
@@ -161,6 +179,73 @@ PADDING = 30
 TITLE_BLOCK_HEIGHT = 180
 TITLE_BLOCK_WIDTH = 594
 
+# Precompiled patterns
+
+_INSTRUMENT_TAG_RE = re.compile(r'^[A-Z]{2,4}-?\d{3,4}[A-Z]?$')  # ISA instrument tag
+_PIPE_SPEC_RE = re.compile(r'^(\d+)"?-([A-Z]+)-(\d+)-([A-Z]+)$')  # e.g. 2"-PG-101-CS
+_POLYLINE_POINT_RE = re.compile(r'\(([-\d.]+),\s*([-\d.]+)\)')  # (x, y)
+# Halo text: attributes after paint-order="stroke" style the halo only
+_HALO_TEXT_RE = re.compile(r'<text ([^>]*?) paint-order="stroke" ([^>]*)>([^<]*)</text>')
+
+# SVG fragment templates for the hot render loops (%-formatted, no per-call f-string parse)
+
+_GRID_PATH = '<path d="%s" fill="none" stroke="#cccccc" stroke-width="0.5"/>'
+# Unstroked stub from a segment's start to its midpoint; the flow-arrow marker
+# at its end is oriented along the segment by the SVG renderer
+_FLOW_ARROW = '<path d="M %s,%s L %s,%s" fill="none" stroke="none" marker-end="url(#flow-arrow)"/>'
+
+# Title block detail rows: (project_info key, label, x, y). The layout is fixed,
+# so all six label/value pairs are pre-rendered into one template.
+
+_TITLE_BLOCK_FIELDS = [
+    ('drawing_no', "DRAWING NO:", 10, 125),
+    ('date', "DATE:", 210, 125),
+    ('revision', "REV:", 410, 125),
+    ('drawn_by', "DRAWN:", 10, 155),
+    ('checked_by', "CHECKED:", 210, 155),
+    ('approved_by', "APPROVED:", 410, 155),
+]
+_TITLE_BLOCK_DETAILS = ''.join(
+    f'<text x="{x}" y="{y}" font-size="10">{label}</text>'
+    f'<text x="{x + 70}" y="{y}" font-size="10" font-weight="bold">%s</text>'
+    for _, label, x, y in _TITLE_BLOCK_FIELDS
+)
+
+# Shared <defs> entries, emitted only when something in the drawing references them
+
+_3D_TYPES = frozenset(['pump_centrifugal', 'vessel_vertical', 'filter'])
+
+_INSULATION_PATTERN = '''
+    <pattern id="insulation" patternUnits="userSpaceOnUse" width="20" height="10">
+        <path d="M 0,5 Q 5,0 10,5 T 20,5" stroke="black" stroke-width="0.5" fill="none"/>
+    </pattern>'''
+
+_HEAT_TRACE_PATTERN = '''
+    <pattern id="heat-trace" patternUnits="userSpaceOnUse" width="20" height="20">
+        <path d="M 0,10 L 20,10" stroke="red" stroke-width="1" stroke-dasharray="2,2"/>
+    </pattern>'''
+
+_DROP_SHADOW_FILTER = '''
+    <filter id="drop-shadow">
+        <feGaussianBlur in="SourceAlpha" stdDeviation="2"/>
+        <feOffset dx="2" dy="2" result="offsetblur"/>
+        <feFlood flood-color="#000000" flood-opacity="0.3"/>
+        <feComposite in2="offsetblur" operator="in"/>
+        <feMerge>
+            <feMergeNode/>
+            <feMergeNode in="SourceGraphic"/>
+        </feMerge>
+    </filter>
+'''
+
+# Page footer
+
+_FOOTER_HTML = '''
+    <div style="text-align: center; color: #666;">
+    <p>EPS Professional P&ID Generator v2.0 | © 2024 EPS Pvt. Ltd. | ISO 15926 Compliant</p>
+    </div>
+    '''
+
 # Initialize session state
 
 if 'project_info' not in st.session_state:
@@ -180,147 +265,193 @@ if 'project_info' not in st.session_state:
 class ProfessionalPnidComponent:
     """Professional P&ID component with detailed rendering"""
 
-    def __init__(self, row):
-        self.id = str(row['id']).strip()
-        self.tag = row.get('tag', self.id)
-        self.component_type = str(row.get('Component', 'valve')).lower().replace(' ', '_')
-        self.x = float(row.get('x', 0))
-        self.y = float(row.get('y', 0))
-        self.width = float(row.get('Width', 60)) * SYMBOL_SCALE
-        self.height = float(row.get('Height', 60)) * SYMBOL_SCALE
-        self.rotation = float(row.get('rotation', 0))
+    # Connection ports as (fraction of width, fraction of height), shared by all instances
+    _PORT_TEMPLATES = {
+        'instrument': {
+            'center': (0.5, 0.5),
+            'top': (0.5, 0.0),
+            'bottom': (0.5, 1.0),
+            'left': (0.0, 0.5),
+            'right': (1.0, 0.5),
+            'default': (0.5, 0.5)
+        },
+        'pump': {
+            'suction': (0.0, 0.6),
+            'discharge': (0.5, 0.0),
+            'drain': (0.2, 1.0),
+            'vent': (0.8, 0.0),
+            'seal_flush': (1.0, 0.3),
+            'default': (0.0, 0.6)
+        },
+        'valve': {
+            'inlet': (0.0, 0.5),
+            'outlet': (1.0, 0.5),
+            'stem': (0.5, 0.0),
+            'body_drain': (0.5, 1.0),
+            'default': (0.0, 0.5)
+        },
+        'vessel': {
+            'top': (0.5, 0.0),
+            'bottom': (0.5, 1.0),
+            'inlet': (0.0, 0.3),
+            'outlet': (1.0, 0.7),
+            'drain': (0.3, 1.0),
+            'vent': (0.7, 0.0),
+            'level_tap_high': (0.0, 0.2),
+            'level_tap_low': (0.0, 0.8),
+            'default': (0.5, 0.5)
+        },
+        'filter': {
+            'inlet': (0.5, 0.0),
+            'outlet': (0.5, 1.0),
+            'drain': (0.2, 0.9),
+            'vent': (0.8, 0.1),
+            'dp_high': (0.0, 0.3),
+            'dp_low': (0.0, 0.7),
+            'default': (0.5, 0.0)
+        },
+        'generic': {
+            'inlet': (0.0, 0.5),
+            'outlet': (1.0, 0.5),
+            'top': (0.5, 0.0),
+            'bottom': (0.5, 1.0),
+            'default': (0.5, 0.5)
+        },
+    }
+
+    def __init__(self, id, tag=None, component_type='valve', x=0.0, y=0.0, width=60.0, height=60.0,
+                 rotation=0.0, material='CS', rating='150#', size='', is_instrument=None):
+        self.id = id
+        self.tag = id if tag is None else tag
+        self.component_type = component_type
+        self.x = float(x)
+        self.y = float(y)
+        self.width = float(width)
+        self.height = float(height)
+        self.rotation = float(rotation)
+        if self.rotation != 0:
+            angle = math.radians(self.rotation)
+            self._cos, self._sin = math.cos(angle), math.sin(angle)
         
-        # Check if instrument
-        self.is_instrument = self._check_if_instrument()
+        # Check if instrument (builders pass a precomputed flag)
+        self.is_instrument = self._check_if_instrument() if is_instrument is None else bool(is_instrument)
         
-        # Define connection ports based on type
-        self.ports = self._define_professional_ports()
+        # Connection ports based on type (shared template, do not mutate)
+        self.ports = self._PORT_TEMPLATES[self._define_professional_ports()]
         
         # Additional properties for professional rendering
-        self.material = row.get('material', 'CS')  # Carbon Steel default
-        self.rating = row.get('rating', '150#')
-        self.size = row.get('size', '')
+        self.material = material  # Carbon Steel default
+        self.rating = rating
+        self.size = size
 
     def _check_if_instrument(self):
         """Check if component is an instrument based on tag pattern"""
         if not self.tag:
             return False
         
-        # ISA instrument tag pattern
-        pattern = r'^[A-Z]{2,4}[-]?\d{3,4}[A-Z]?$'
-        return bool(re.match(pattern, self.tag))
+        return bool(_INSTRUMENT_TAG_RE.match(self.tag))
 
     def _define_professional_ports(self):
-        """Define detailed connection ports for professional P&ID"""
-        ports = {}
-        
+        """Pick the connection port template for this component type"""
         if self.is_instrument:
-            # Instrument standard ports
-            ports = {
-                'center': {'dx': self.width/2, 'dy': self.height/2},
-                'top': {'dx': self.width/2, 'dy': 0},
-                'bottom': {'dx': self.width/2, 'dy': self.height},
-                'left': {'dx': 0, 'dy': self.height/2},
-                'right': {'dx': self.width, 'dy': self.height/2},
-                'default': {'dx': self.width/2, 'dy': self.height/2}
-            }
+            return 'instrument'
         elif 'pump' in self.component_type:
-            ports = {
-                'suction': {'dx': 0, 'dy': self.height * 0.6},
-                'discharge': {'dx': self.width * 0.5, 'dy': 0},
-                'drain': {'dx': self.width * 0.2, 'dy': self.height},
-                'vent': {'dx': self.width * 0.8, 'dy': 0},
-                'seal_flush': {'dx': self.width, 'dy': self.height * 0.3},
-                'default': {'dx': 0, 'dy': self.height * 0.6}
-            }
+            return 'pump'
         elif 'valve' in self.component_type:
-            ports = {
-                'inlet': {'dx': 0, 'dy': self.height/2},
-                'outlet': {'dx': self.width, 'dy': self.height/2},
-                'stem': {'dx': self.width/2, 'dy': 0},
-                'body_drain': {'dx': self.width/2, 'dy': self.height},
-                'default': {'dx': 0, 'dy': self.height/2}
-            }
+            return 'valve'
         elif 'vessel' in self.component_type or 'tank' in self.component_type:
-            ports = {
-                'top': {'dx': self.width/2, 'dy': 0},
-                'bottom': {'dx': self.width/2, 'dy': self.height},
-                'inlet': {'dx': 0, 'dy': self.height * 0.3},
-                'outlet': {'dx': self.width, 'dy': self.height * 0.7},
-                'drain': {'dx': self.width * 0.3, 'dy': self.height},
-                'vent': {'dx': self.width * 0.7, 'dy': 0},
-                'level_tap_high': {'dx': 0, 'dy': self.height * 0.2},
-                'level_tap_low': {'dx': 0, 'dy': self.height * 0.8},
-                'default': {'dx': self.width/2, 'dy': self.height/2}
-            }
+            return 'vessel'
         elif 'filter' in self.component_type:
-            ports = {
-                'inlet': {'dx': self.width/2, 'dy': 0},
-                'outlet': {'dx': self.width/2, 'dy': self.height},
-                'drain': {'dx': self.width * 0.2, 'dy': self.height * 0.9},
-                'vent': {'dx': self.width * 0.8, 'dy': self.height * 0.1},
-                'dp_high': {'dx': 0, 'dy': self.height * 0.3},
-                'dp_low': {'dx': 0, 'dy': self.height * 0.7},
-                'default': {'dx': self.width/2, 'dy': 0}
-            }
-        else:
-            # Generic ports
-            ports = {
-                'inlet': {'dx': 0, 'dy': self.height/2},
-                'outlet': {'dx': self.width, 'dy': self.height/2},
-                'top': {'dx': self.width/2, 'dy': 0},
-                'bottom': {'dx': self.width/2, 'dy': self.height},
-                'default': {'dx': self.width/2, 'dy': self.height/2}
-            }
-        
-        return ports
+            return 'filter'
+        return 'generic'
 
     def get_port_coords(self, port_name):
         """Get absolute coordinates for a connection port"""
-        port = self.ports.get(port_name) or self.ports.get('default')
-        if port:
-            # Apply rotation if needed
-            if self.rotation != 0:
-                # Rotate port position around component center
-                cx, cy = self.width/2, self.height/2
-                dx, dy = port['dx'] - cx, port['dy'] - cy
-                
-                angle = math.radians(self.rotation)
-                new_dx = dx * math.cos(angle) - dy * math.sin(angle) + cx
-                new_dy = dx * math.sin(angle) + dy * math.cos(angle) + cy
-                
-                return (self.x + new_dx, self.y + new_dy)
-            else:
-                return (self.x + port['dx'], self.y + port['dy'])
+        fx, fy = self.ports.get(port_name) or self.ports['default']
+        dx, dy = fx * self.width, fy * self.height
+        
+        # Apply rotation if needed
+        if self.rotation != 0:
+            # Rotate port position around component center
+            cx, cy = self.width/2, self.height/2
+            dx, dy = dx - cx, dy - cy
+            new_dx = dx * self._cos - dy * self._sin + cx
+            new_dy = dx * self._sin + dy * self._cos + cy
+            
+            return (self.x + new_dx, self.y + new_dy)
         
-        return (self.x + self.width/2, self.y + self.height/2)
+        return (self.x + dx, self.y + dy)
+
+
+class ComponentTable:
+    """
+    Struct-of-arrays view of the equipment list. Geometry lives in parallel
+    NumPy arrays so obstacle registration and bounding-box work run as array
+    operations; ProfessionalPnidComponent objects are built from it for OO use.
+    """
+
+    def __init__(self, ids, tags, types, xs, ys, widths, heights, rotations,
+                 materials, ratings, sizes, is_instrument):
+        self.ids = ids
+        self.tags = tags
+        self.types = types
+        self.xs = xs
+        self.ys = ys
+        self.widths = widths
+        self.heights = heights
+        self.rotations = rotations
+        self.materials = materials
+        self.ratings = ratings
+        self.sizes = sizes
+        self.is_instrument = is_instrument
+        # Later rows win when ids repeat, matching the components dict
+        self.is_current = ~pd.Index(ids).duplicated(keep='last')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, other):
+        """New table with other's rows appended"""
+        fields = ('ids', 'tags', 'types', 'xs', 'ys', 'widths', 'heights', 'rotations',
+                  'materials', 'ratings', 'sizes', 'is_instrument')
+        return ComponentTable(*(np.concatenate([getattr(self, f), getattr(other, f)]) for f in fields))
+
+    def to_components(self):
+        """ProfessionalPnidComponent objects keyed by id"""
+        components = {}
+        for i in range(len(self.ids)):
+            components[self.ids[i]] = ProfessionalPnidComponent(
+                self.ids[i], self.tags[i], self.types[i], self.xs[i], self.ys[i],
+                self.widths[i], self.heights[i], self.rotations[i], self.materials[i],
+                self.ratings[i], self.sizes[i], self.is_instrument[i]
+            )
+        return components
 
 
 class ProfessionalPnidPipe:
     """Professional P&ID pipe with detailed specifications"""
 
-    def __init__(self, row, component_map, router=None):
-        self.id = row.get('Pipe No.', '')
-        self.label = row.get('Label', '')
-        self.line_type = row.get('pipe_type', 'process_line')
+    def __init__(self, pipe_id, component_map, from_comp_id='', to_comp_id='', from_port='default',
+                 to_port='default', polyline_str='', label='', line_type='process_line',
+                 insulation=False, heat_traced=False, router=None, smart_routing=False, points=None):
+        self.id = pipe_id
+        self.label = label
+        self.line_type = line_type
         
         # Parse pipe specification
         self._parse_pipe_spec()
         
         # Get components
-        from_comp_id = str(row.get('From Component', '')).strip()
-        to_comp_id = str(row.get('To Component', '')).strip()
-        
         self.from_comp = component_map.get(from_comp_id)
         self.to_comp = component_map.get(to_comp_id)
         
-        self.from_port = row.get('From Port', 'default')
-        self.to_port = row.get('To Port', 'default')
-        
-        # Parse or calculate path
-        polyline_str = str(row.get('Polyline Points (x, y)', '')).strip()
+        self.from_port = from_port
+        self.to_port = to_port
         
-        if enable_smart_routing and router and not polyline_str and self.from_comp and self.to_comp:
+        # Parse or calculate path (builders may pass precomputed points)
+        if points is not None:
+            self.points = points
+        elif smart_routing and router and not polyline_str and self.from_comp and self.to_comp:
             # Use smart routing
             start = self.from_comp.get_port_coords(self.from_port)
             end = self.to_comp.get_port_coords(self.to_port)
@@ -333,13 +464,13 @@ class ProfessionalPnidPipe:
         self.with_arrow = self.line_type in ['process_line', 'process']
         
         # Additional properties
-        self.insulation = row.get('insulation', False)
-        self.heat_traced = row.get('heat_traced', False)
+        self.insulation = insulation
+        self.heat_traced = heat_traced
 
     def _parse_pipe_spec(self):
         """Parse pipe specification like 2"-PG-101-CS"""
         if self.label:
-            match = re.match(r'^(\d+)"?-([A-Z]+)-(\d+)-([A-Z]+)$', self.label)
+            match = _PIPE_SPEC_RE.match(self.label)
             if match:
                 self.size = int(match.group(1))
                 self.service = match.group(2)
@@ -358,13 +489,7 @@ class ProfessionalPnidPipe:
 
     def _parse_polyline_points(self, polyline_str):
         """Parse polyline points from string"""
-        points = []
-        
-        if polyline_str and polyline_str.lower() != 'nan':
-            # Parse points like [(x1,y1), (x2,y2)]
-            pts = re.findall(r'\(([-\d.]+),\s*([-\d.]+)\)', polyline_str)
-            if pts:
-                points = [(float(x), float(y)) for x, y in pts]
+        points = parse_polyline(polyline_str)
         
         # If no valid points but we have components, create simple path
         if not points and self.from_comp and self.to_comp:
@@ -403,11 +528,47 @@ class ProfessionalPnidPipe:
         points.append(end)
         return points
 
+def parse_polyline(polyline_str):
+    """Parse points like [(x1,y1), (x2,y2)] from a polyline string"""
+    if polyline_str and polyline_str.lower() != 'nan':
+        pts = _POLYLINE_POINT_RE.findall(polyline_str)
+        if pts:
+            return [(float(x), float(y)) for x, y in pts]
+    return []
+
+
+def orthogonal_paths(from_xy, to_xy):
+    """
+    Batch version of ProfessionalPnidPipe._create_orthogonal_path for
+    (N, 2) arrays of start and end points. Returns a list of point lists.
+    """
+    paths, bent = geometry_kernels.orthogonal_paths(from_xy, to_xy)
+    return [
+        [tuple(p) for p in path] if is_bent else [tuple(path[0]), tuple(path[1]), tuple(path[3])]
+        for path, is_bent in zip(paths.tolist(), bent.tolist())
+    ]
+
+
+def port_coords(components, comp_ids, port_names):
+    """Batch ProfessionalPnidComponent.get_port_coords; returns an (N, 2) array"""
+    comps = [components[cid] for cid in comp_ids]
+    fractions = [c.ports.get(p) or c.ports['default'] for c, p in zip(comps, port_names)]
+    return geometry_kernels.port_coords_batch(
+        [c.x for c in comps], [c.y for c in comps],
+        [c.width for c in comps], [c.height for c in comps],
+        [f[0] for f in fractions], [f[1] for f in fractions],
+        [c.rotation for c in comps]
+    )
+
 # — MAIN RENDERING FUNCTION —
 
-def render_final_professional_pnid(components, pipes, project_info):
+def render_final_professional_pnid(components, pipes, project_info, drawing_size="A3", grid_visible=True,
+                                   grid_spacing=25, flow_arrows=True, annotations_visible=True,
+                                   line_weights=None, enable_3d=True):
     """Render the final professional-quality P&ID"""
 
+    line_weights = line_weights or {}
+
     # Initialize professional renderer
     renderer = ProfessionalRenderer()
 
@@ -416,79 +577,68 @@ def render_final_professional_pnid(components, pipes, project_info):
     width *= 10  # Convert to pixels (assuming 10px/mm)
     height *= 10
 
-    # Start SVG
+    # Start SVG. Fragments are collected with a bound append and joined once at
+    # the end; a single join is one copy, cheaper than growing a bytes buffer.
     svg_parts = []
-    svg_parts.append(f'''<?xml version="1.0" encoding="UTF-8"?>
+    append = svg_parts.append
+    append(f'''<?xml version="1.0" encoding="UTF-8"?>
 <!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
 <svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" 
-xmlns="http://www.w3.org/2000/svg" version="1.1"
+xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1"
 style="font-family: Arial, Helvetica, sans-serif; background-color: white;">''')
 
-    # Add professional definitions
-    svg_parts.append(ARROW_MARKERS)
-    svg_parts.append('<defs>')
-
-    # Add all professional symbols
-    for symbol_id, symbol_svg in PROFESSIONAL_ISA_SYMBOLS.items():
-        svg_parts.append(symbol_svg)
-
-    # Add custom patterns and filters
-    svg_parts.append('''
-    <pattern id="insulation" patternUnits="userSpaceOnUse" width="20" height="10">
-        <path d="M 0,5 Q 5,0 10,5 T 20,5" stroke="black" stroke-width="0.5" fill="none"/>
-    </pattern>
-    
-    <pattern id="heat-trace" patternUnits="userSpaceOnUse" width="20" height="20">
-        <path d="M 0,10 L 20,10" stroke="red" stroke-width="1" stroke-dasharray="2,2"/>
-    </pattern>
-    
-    <filter id="drop-shadow">
-        <feGaussianBlur in="SourceAlpha" stdDeviation="2"/>
-        <feOffset dx="2" dy="2" result="offsetblur"/>
-        <feFlood flood-color="#000000" flood-opacity="0.3"/>
-        <feComposite in2="offsetblur" operator="in"/>
-        <feMerge>
-            <feMergeNode/>
-            <feMergeNode in="SourceGraphic"/>
-        </feMerge>
-    </filter>
-</defs>''')
+    # Add professional definitions: markers, then only the symbols this drawing uses
+    equipment = [comp for comp in components.values() if not comp.is_instrument]
+    used_symbols = frozenset(get_symbol_id(comp.component_type) for comp in equipment)
+    append(ARROW_MARKERS)
+    append(render_symbol_defs(used_symbols))
+    append('<defs>')
+
+    # Add custom patterns and filters that are referenced
+    if any(pipe.insulation for pipe in pipes):
+        append(_INSULATION_PATTERN)
+    if any(pipe.heat_traced for pipe in pipes):
+        append(_HEAT_TRACE_PATTERN)
+    if enable_3d and any(comp.component_type in _3D_TYPES and PROFESSIONAL_ISA_SYMBOLS.get(get_symbol_id(comp.component_type))
+                         for comp in equipment):
+        append(_DROP_SHADOW_FILTER)
+    append('</defs>')
 
     # Layers
-    svg_parts.append('')
-    if GRID_VISIBLE:
-        svg_parts.append(f'<g id="grid" opacity="0.3">')
-        # Grid lines
-        for x in range(0, int(width), GRID_SPACING * 4):
-            svg_parts.append(f'<line x1="{x}" y1="0" x2="{x}" y2="{height}" stroke="#cccccc" stroke-width="0.5"/>')
-        for y in range(0, int(height), GRID_SPACING * 4):
-            svg_parts.append(f'<line x1="0" y1="{y}" x2="{x}" y2="{y}" stroke="#cccccc" stroke-width="0.5"/>') # Corrected x2 to x, not width
-        svg_parts.append('</g>')
+    append('')
+    if grid_visible:
+        append(f'<g id="grid" opacity="0.3">')
+        # Grid lines as a single path: one DOM node instead of one <line> each
+        step = grid_spacing * 4
+        grid_d = ' '.join(['M%d,0V%d' % (x, height) for x in range(0, int(width), step)] +
+                          ['M0,%dH%d' % (y, width) for y in range(0, int(height), step)])
+        append(_GRID_PATH % grid_d)
+        append('</g>')
 
     # Drawing border
-    svg_parts.append('')
-    svg_parts.append(f'<rect x="{PADDING}" y="{PADDING}" width="{width-PADDING*2}" height="{height-PADDING*2}" '
-                    f'fill="none" stroke="black" stroke-width="3"/>')
-    svg_parts.append(f'<rect x="{PADDING+5}" y="{PADDING+5}" width="{width-PADDING*2-10}" height="{height-PADDING*2-10}" '
-                    f'fill="none" stroke="black" stroke-width="1"/>')
+    append('')
+    append(f'<rect x="{PADDING}" y="{PADDING}" width="{width-PADDING*2}" height="{height-PADDING*2}" '
+           f'fill="none" stroke="black" stroke-width="3"/>')
+    append(f'<rect x="{PADDING+5}" y="{PADDING+5}" width="{width-PADDING*2-10}" height="{height-PADDING*2-10}" '
+           f'fill="none" stroke="black" stroke-width="1"/>')
 
     # Equipment layer
-    svg_parts.append('')
-    svg_parts.append('<g id="equipment">')
+    append('')
+    append('<g id="equipment">')
 
     for comp in components.values():
         if comp.is_instrument:
             # Render professional instrument bubble
-            svg_parts.append(create_professional_instrument_bubble(
+            append(create_professional_instrument_bubble(
                 comp.tag,
                 comp.x + comp.width/2,
                 comp.y + comp.height/2,
                 min(comp.width, comp.height) / 2
             ))
         else:
-            # Get professional symbol
-            symbol = get_component_symbol(comp.component_type)
-            if symbol:
+            # Get professional symbol (defined once in <defs>)
+            symbol_id = get_symbol_id(comp.component_type)
+            if symbol_id in PROFESSIONAL_ISA_SYMBOLS:
                 # Apply transformations
                 transform = f'translate({comp.x},{comp.y})'
                 if comp.rotation:
@@ -498,15 +648,13 @@ style="font-family: Arial, Helvetica, sans-serif; background-color: white;">''')
                 
                 # Add 3D effect for major equipment
                 filter_attr = ''
-                if enable_3d_symbols and comp.component_type in ['pump_centrifugal', 'vessel_vertical', 'filter']:
+                if enable_3d and comp.component_type in _3D_TYPES:
                     filter_attr = 'filter="url(#drop-shadow)"'
                 
-                svg_parts.append(f'<g transform="{transform}" {filter_attr}>')
+                append(f'<g transform="{transform}" {filter_attr}>')
                 
-                # Scale symbol to component size
-                svg_parts.append(f'<g transform="scale({comp.width/80},{comp.height/80})">')
-                svg_parts.append(symbol)
-                svg_parts.append('</g>')
+                # Reference the symbol, scaled to component size
+                append(create_symbol_use(symbol_id, comp.width, comp.height))
                 
                 # Add tag with professional styling
                 if comp.tag:
@@ -514,114 +662,181 @@ style="font-family: Arial, Helvetica, sans-serif; background-color: white;">''')
                     tag_y = comp.height + 15
                     
                     # Tag background
-                    svg_parts.append(f'<rect x="{comp.width/2 - tag_bg_width/2}" y="{tag_y - 12}" '
-                                   f'width="{tag_bg_width}" height="16" '
-                                   f'fill="white" stroke="black" stroke-width="0.5" rx="2"/>')
+                    append(f'<rect x="{comp.width/2 - tag_bg_width/2}" y="{tag_y - 12}" '
+                           f'width="{tag_bg_width}" height="16" '
+                           f'fill="white" stroke="black" stroke-width="0.5" rx="2"/>')
                     
                     # Tag text
-                    svg_parts.append(f'<text x="{comp.width/2}" y="{tag_y}" '
-                                   f'text-anchor="middle" font-size="11" font-weight="bold">{comp.tag}</text>')
+                    append(f'<text x="{comp.width/2}" y="{tag_y}" '
+                           f'text-anchor="middle" font-size="11" font-weight="bold">{comp.tag}</text>')
                 
-                svg_parts.append('</g>')
+                append('</g>')
 
-    svg_parts.append('</g>')
+    append('</g>')
 
     # Piping layer
-    svg_parts.append('')
-    svg_parts.append('<g id="piping">')
+    append('')
+    append('<g id="piping">')
 
     for pipe in pipes:
         if len(pipe.points) >= 2:
             # Determine line weight based on size
-            line_weight = line_weight_options.get("Major Process", 3.0) if pipe.size >= 4 else line_weight_options.get("Minor Process", 2.0)
+            line_weight = line_weights.get("Major Process", 3.0) if pipe.size >= 4 else line_weights.get("Minor Process", 2.0)
             
             if pipe.line_type in ['instrumentation', 'instrument_signal']:
-                line_weight = line_weight_options.get("Instrument Signal", 0.7)
+                line_weight = line_weights.get("Instrument Signal", 0.7)
             elif pipe.line_type == 'electrical':
-                line_weight = line_weight_options.get("Electrical", 0.7)
+                line_weight = line_weights.get("Electrical", 0.7)
             
             # Create professional pipe path
-            svg_parts.append(create_pipe_with_spec(
+            append(create_pipe_with_spec(
                 pipe.points,
                 pipe.label,
                 pipe.line_type
             ))
             
             # Add flow arrows if enabled
-            if FLOW_ARROWS and pipe.with_arrow and len(pipe.points) >= 2:
+            if flow_arrows and pipe.with_arrow and len(pipe.points) >= 2:
                 # Add arrow at 1/3 and 2/3 points
                 for fraction in [0.33, 0.67]:
                     idx = int(len(pipe.points) * fraction)
                     if idx > 0 and idx < len(pipe.points):
                         p1 = pipe.points[idx-1]
                         p2 = pipe.points[idx]
-                        
-                        angle = math.degrees(math.atan2(p2[1] - p1[1], p2[0] - p1[0]))
                         mid_x = (p1[0] + p2[0]) / 2
                         mid_y = (p1[1] + p2[1]) / 2
-                        
-                        svg_parts.append(f'<g transform="translate({mid_x},{mid_y}) rotate({angle})">')
-                        svg_parts.append(f'<polygon points="-8,-4 0,0 -8,4" fill="black"/>')
-                        svg_parts.append('</g>')
+                        append(_FLOW_ARROW % (p1[0], p1[1], mid_x, mid_y))
 
-    svg_parts.append('</g>')
+    append('</g>')
 
     # Annotations layer
-    if ANNOTATIONS_VISIBLE:
-        svg_parts.append('')
-        svg_parts.append('<g id="annotations">')
+    if annotations_visible:
+        append('')
+        append('<g id="annotations">')
         
         # Add equipment callouts, dimensions, etc.
         # This would be expanded based on specific requirements
         
-        svg_parts.append('</g>')
+        append('</g>')
 
     # Title block
-    svg_parts.append('')
+    append('')
     tb_x = width - TITLE_BLOCK_WIDTH - PADDING - 10
     tb_y = height - TITLE_BLOCK_HEIGHT - PADDING - 10
 
-    svg_parts.append(f'<g transform="translate({tb_x},{tb_y})">')
+    append(f'<g transform="translate({tb_x},{tb_y})">')
 
     # Title block border
-    svg_parts.append(f'<rect x="0" y="0" width="{TITLE_BLOCK_WIDTH}" height="{TITLE_BLOCK_HEIGHT}" '
-                    f'fill="white" stroke="black" stroke-width="2"/>')
+    append(f'<rect x="0" y="0" width="{TITLE_BLOCK_WIDTH}" height="{TITLE_BLOCK_HEIGHT}" '
+           f'fill="white" stroke="black" stroke-width="2"/>')
 
     # Internal divisions
     divisions = [40, 80, 110, 140, 160]
     for y in divisions:
-        svg_parts.append(f'<line x1="0" y1="{y}" x2="{TITLE_BLOCK_WIDTH}" y2="{y}" stroke="black" stroke-width="1"/>')
+        append(f'<line x1="0" y1="{y}" x2="{TITLE_BLOCK_WIDTH}" y2="{y}" stroke="black" stroke-width="1"/>')
 
     # Vertical divisions
-    svg_parts.append(f'<line x1="200" y1="0" x2="200" y2="140" stroke="black" stroke-width="1"/>')
-    svg_parts.append(f'<line x1="400" y1="0" x2="400" y2="140" stroke="black" stroke-width="1"/>')
+    append(f'<line x1="200" y1="0" x2="200" y2="140" stroke="black" stroke-width="1"/>')
+    append(f'<line x1="400" y1="0" x2="400" y2="140" stroke="black" stroke-width="1"/>')
 
     # Content
-    svg_parts.append(f'<text x="100" y="25" text-anchor="middle" font-size="18" font-weight="bold">{project_info["client"]}</text>')
-    svg_parts.append(f'<text x="300" y="60" text-anchor="middle" font-size="14" font-weight="bold">PIPING AND INSTRUMENTATION DIAGRAM</text>')
-    svg_parts.append(f'<text x="300" y="100" text-anchor="middle" font-size="12">{project_info["project"]}</text>')
+    append(f'<text x="100" y="25" text-anchor="middle" font-size="18" font-weight="bold">{project_info["client"]}</text>')
+    append(f'<text x="300" y="60" text-anchor="middle" font-size="14" font-weight="bold">PIPING AND INSTRUMENTATION DIAGRAM</text>')
+    append(f'<text x="300" y="100" text-anchor="middle" font-size="12">{project_info["project"]}</text>')
 
     # Details
-    details = [
-        ("DRAWING NO:", project_info['drawing_no'], 10, 125),
-        ("DATE:", project_info['date'], 210, 125),
-        ("REV:", project_info['revision'], 410, 125),
-        ("DRAWN:", project_info['drawn_by'], 10, 155),
-        ("CHECKED:", project_info['checked_by'], 210, 155),
-        ("APPROVED:", project_info['approved_by'], 410, 155),
-    ]
+    append(_TITLE_BLOCK_DETAILS % tuple(project_info[key] for key, _, _, _ in _TITLE_BLOCK_FIELDS))
 
-    for label, value, x, y in details:
-        svg_parts.append(f'<text x="{x}" y="{y}" font-size="10">{label}</text>')
-        svg_parts.append(f'<text x="{x + 70}" y="{y}" font-size="10" font-weight="bold">{value}</text>')
+    append('</g>')
 
-    svg_parts.append('</g>')
-
-    svg_parts.append('</svg>')
+    append('</svg>')
 
     return ''.join(svg_parts)
 
 
+# The SVG and PNG caches hold immutable bytes, so they are resources: every
+# rerun gets the cached object itself rather than an unpickled copy of it.
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def render_svg(geometry_sig, _components, _pipes, project_info, drawing_size, visual_sig, enable_3d):
+    """
+    Cached wrapper around render_final_professional_pnid. geometry_sig identifies
+    the (unhashed) component/pipe objects and visual_sig the submitted visual
+    controls, so widget changes that don't touch the drawing return the previous
+    SVG without re-rendering. Returns UTF-8 bytes, ready for the rasterizer and
+    the download button without a per-rerun encode.
+    """
+    grid_visible, grid_spacing, flow_arrows, annotations_visible, line_weights = visual_sig
+    return render_final_professional_pnid(
+        _components, _pipes, project_info, drawing_size, grid_visible, grid_spacing,
+        flow_arrows, annotations_visible, dict(line_weights), enable_3d
+    ).encode('utf-8')
+
+
+@st.cache_resource(show_spinner=False)
+def _get_svg_minifier():
+    """scour-based SVG minifier, or None when scour is not installed"""
+    try:
+        from scour import scour
+    except ImportError:
+        return None
+
+    # Default 5-digit precision: lower settings visibly move coordinates on large sheets
+    options = scour.sanitizeOptions(None)
+    options.enable_id_stripping = True
+    options.shorten_ids = True
+    options.quiet = True
+    return lambda svg: scour.scourString(svg, options)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_rasterizer():
+    """
+    SVG-to-PNG function, imported on first use. Prefers resvg, which parses and
+    renders natively; falls back to cairosvg (loads libcairo).
+    """
+    try:
+        import resvg_py
+    except ImportError:
+        pass
+    else:
+        return lambda svg_bytes, width: resvg_py.svg_to_bytes(svg_string=svg_bytes.decode('utf-8'), width=width)
+
+    from cairosvg import svg2png
+    minify = _get_svg_minifier()
+
+    def rasterize(svg_bytes, width):
+        svg_text = svg_bytes.decode('utf-8')
+        # cairosvg ignores paint-order, so draw each halo as its own text underneath
+        svg_text = _HALO_TEXT_RE.sub(r'<text \1 \2>\3</text><text \1>\3</text>', svg_text)
+        # A minified document means less XML for cairosvg's Python-side parser to build
+        if minify is not None:
+            svg_text = minify(svg_text)
+        return svg2png(bytestring=svg_text.encode('utf-8'), output_width=width)
+    return rasterize
+
+
+@st.cache_resource(show_spinner=False)
+def _raster_executor():
+    """Worker pool shared by all sessions; caps how many rasterizations run at once"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="svg2png")
+
+
+def svg_digest(svg_bytes):
+    """Short content key for SVG bytes (BLAKE2b, faster than the MD5 Streamlit would use)"""
+    return hashlib.blake2b(svg_bytes, digest_size=16).digest()
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def rasterize_svg(svg_key, _svg_bytes, output_width):
+    """
+    Rasterize UTF-8 SVG bytes to PNG bytes. Shared across sessions and keyed
+    on svg_digest() of the content and the width, so viewers of the same
+    drawing reuse one raster.
+    """
+    return _raster_executor().submit(_get_rasterizer(), _svg_bytes, output_width).result()
+
+
 # — MAIN APPLICATION —
 
 # Load data
@@ -655,24 +870,213 @@ def load_professional_data():
         return eq_df, pipe_df
 
 
+def _hash_dataframe(df):
+    """Content hash of a DataFrame (columns + values) for use as a cache key"""
+    values = pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    return hash((tuple(df.columns), values))
+
+
+def get_data_signature():
+    """
+    Returns (eq_sig, pipe_sig) for the session's data. The DataFrames are
+    only re-hashed when data_version is bumped, so plain widget reruns are cheap.
+    """
+    version = st.session_state.data_version
+    cached = st.session_state.get('data_signature')
+    if cached is None or cached[0] != version:
+        cached = (
+            version,
+            _hash_dataframe(st.session_state.eq_df),
+            _hash_dataframe(st.session_state.pipe_df),
+        )
+        st.session_state.data_signature = cached
+    return cached[1], cached[2]
+
+
+def _column(df, name, default, dtype=object):
+    """Column as a NumPy array, or a constant array when the column is absent"""
+    if name in df.columns:
+        return df[name].to_numpy(dtype=dtype)
+    return np.full(len(df), default, dtype=dtype)
+
+
+def _str_column(df, name, default=''):
+    """Column converted with str() and stripped, as a NumPy array"""
+    if name in df.columns:
+        return df[name].map(str).str.strip().to_numpy(dtype=object)
+    return np.full(len(df), default, dtype=object)
+
+
+# Object graph builders. Cached as resources (not pickled) so the live
+# component objects and the router's obstacle grid are shared across reruns.
+# Underscore-prefixed arguments are excluded from the cache key.
+
+def _component_table(_eq_df, symbol_scale):
+    """ComponentTable for an equipment dataframe"""
+    # Pull each column out once instead of materializing a Series per row
+    ids = _str_column(_eq_df, 'id')
+    tags = _column(_eq_df, 'tag', None) if 'tag' in _eq_df.columns else ids.copy()
+    is_instrument = pd.Series(tags, dtype=object).str.match(_INSTRUMENT_TAG_RE).fillna(False).to_numpy(dtype=bool)
+    types = _eq_df['Component'].astype(str).str.lower().str.replace(' ', '_').to_numpy(dtype=object) \
+        if 'Component' in _eq_df.columns else np.full(len(_eq_df), 'valve', dtype=object)
+    xs = _column(_eq_df, 'x', 0.0, np.float64)
+    ys = _column(_eq_df, 'y', 0.0, np.float64)
+    widths = _column(_eq_df, 'Width', 60.0, np.float64) * symbol_scale
+    heights = _column(_eq_df, 'Height', 60.0, np.float64) * symbol_scale
+    rotations = _column(_eq_df, 'rotation', 0.0, np.float64)
+    materials = _column(_eq_df, 'material', 'CS')
+    ratings = _column(_eq_df, 'rating', '150#')
+    sizes = _column(_eq_df, 'size', '')
+
+    return ComponentTable(ids, tags, types, xs, ys, widths, heights, rotations,
+                          materials, ratings, sizes, is_instrument)
+
+
+@st.cache_resource(show_spinner=False, ttl=24*60*60, max_entries=8)
+def build_component_table(eq_sig, _eq_df, symbol_scale, _pending=()):
+    """Build the ComponentTable for the equipment dataframe plus pending additions"""
+    table = _component_table(_eq_df, symbol_scale)
+    if _pending:
+        table = table.extend(_component_table(pd.DataFrame(list(_pending)), symbol_scale))
+    return table
+
+
+@st.cache_resource(show_spinner=False, ttl=24*60*60, max_entries=8)
+def build_components(eq_sig, _eq_df, symbol_scale, _pending=()):
+    """Build ProfessionalPnidComponent objects keyed by id"""
+    return build_component_table(eq_sig, _eq_df, symbol_scale, _pending).to_components()
+
+
+@st.cache_resource(show_spinner=False, ttl=24*60*60, max_entries=8)
+def build_router(eq_sig, _eq_df, symbol_scale, _pending=()):
+    """Build a PipeRouter with every component registered as an obstacle"""
+    table = build_component_table(eq_sig, _eq_df, symbol_scale, _pending)
+    keep = table.is_current
+    router = PipeRouter(grid_size=10)
+    router.add_obstacles(table.xs[keep], table.ys[keep], table.widths[keep], table.heights[keep], padding=20)
+    return router
+
+
+@st.cache_resource(show_spinner=False, ttl=24*60*60, max_entries=8)
+def build_pipes(pipe_sig, _pipe_df, eq_sig, _eq_df, symbol_scale, smart_routing, _pending=()):
+    """Build ProfessionalPnidPipe objects against the cached components"""
+    components = build_components(eq_sig, _eq_df, symbol_scale, _pending)
+    router = build_router(eq_sig, _eq_df, symbol_scale, _pending) if smart_routing else None
+
+    pipe_ids = _column(_pipe_df, 'Pipe No.', '')
+    from_ids = _str_column(_pipe_df, 'From Component')
+    to_ids = _str_column(_pipe_df, 'To Component')
+    from_ports = _column(_pipe_df, 'From Port', 'default')
+    to_ports = _column(_pipe_df, 'To Port', 'default')
+    polylines = _str_column(_pipe_df, 'Polyline Points (x, y)')
+    labels = _column(_pipe_df, 'Label', '')
+    line_types = _column(_pipe_df, 'pipe_type', 'process_line')
+    insulation = _column(_pipe_df, 'insulation', False)
+    heat_traced = _column(_pipe_df, 'heat_traced', False)
+
+    # Resolve geometry up front: explicit polylines are parsed, A* routes are
+    # left to the pipe, and the remaining component-to-component pipes get
+    # their orthogonal paths in one vectorized pass.
+    points = [None] * len(pipe_ids)
+    pending = []
+    for i in range(len(pipe_ids)):
+        connected = from_ids[i] in components and to_ids[i] in components
+        if router is not None and not polylines[i] and connected:
+            continue
+        points[i] = parse_polyline(polylines[i])
+        if not points[i] and connected:
+            pending.append(i)
+
+    if pending:
+        from_xy = port_coords(components, from_ids[pending], from_ports[pending])
+        to_xy = port_coords(components, to_ids[pending], to_ports[pending])
+        for i, path in zip(pending, orthogonal_paths(from_xy, to_xy)):
+            points[i] = path
+
+    return [
+        ProfessionalPnidPipe(
+            pipe_ids[i], components, from_ids[i], to_ids[i], from_ports[i], to_ports[i],
+            polylines[i], labels[i], line_types[i], insulation[i], heat_traced[i],
+            router, smart_routing, points[i]
+        )
+        for i in range(len(pipe_ids))
+    ]
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def drawing_stats(eq_sig, pipe_sig, _components, _pipes):
+    """Counts for the metrics row, gathered in one pass over components and pipes"""
+    stats = {'equipment': 0, 'instruments': 0, 'valves': 0}
+    for comp in _components.values():
+        if comp.is_instrument:
+            stats['instruments'] += 1
+        else:
+            stats['equipment'] += 1
+        if 'valve' in comp.component_type:
+            stats['valves'] += 1
+
+    stats['pipes'] = len(_pipes)
+    stats['line_numbers'] = len({p.label for p in _pipes if p.label})
+    return stats
+
+
+@st.cache_resource(show_spinner=False, ttl=24*60*60)
+def get_analyzer(geometry_sig, _components, _pipes):
+    """Control-loop analysis, run once per set of built components and pipes"""
+    return ControlSystemAnalyzer(_components, _pipes)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def loop_summary(geometry_sig, _control_loops):
+    """Markdown bullet list of control loops, formatted once per analysis"""
+    return "\n".join([
+        f"- **{loop.loop_type.value}** ({loop.loop_id}): "
+        f"{loop.primary_element} → {loop.controller} → {loop.final_element}"
+        for loop in _control_loops
+    ])
+
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl="10m")
+def get_validation(eq_sig, pipe_sig, _components, _pipes, _analyzer):
+    """
+    PnIDValidator results. The checks read tags, types, ports and labels but no
+    geometry, so the result is keyed on the data signatures alone and survives
+    symbol-scale and routing changes.
+    """
+    return PnIDValidator(_components, _pipes, _analyzer).validate_all()
+
+
+def session_validation(eq_sig, pipe_sig, components, pipes, analyzer):
+    """
+    Validation results kept in session state until the drawing data changes, so
+    tab switches and unrelated widget reruns reuse them without a cache lookup.
+    """
+    data_sig = (eq_sig, pipe_sig)
+    if st.session_state.get('validated_sig') != data_sig:
+        st.session_state.validation = get_validation(eq_sig, pipe_sig, components, pipes, analyzer)
+        st.session_state.validated_sig = data_sig
+    return st.session_state.validation
+
+
 # Initialize data
 
 if 'eq_df' not in st.session_state:
     st.session_state.eq_df, st.session_state.pipe_df = load_professional_data()
+    st.session_state.data_version = 0
 
-# Create components and pipes
+# Components added from the Edit tab are buffered here and only concatenated
+# into eq_df on Commit, instead of reallocating and re-hashing it per click
+pending_components = st.session_state.setdefault('pending_components', [])
 
-components = {c.id: c for c in [ProfessionalPnidComponent(row) for _, row in st.session_state.eq_df.iterrows()]}
+# Create components and pipes (rebuilt only when data or geometry settings change)
 
-# Initialize router if smart routing enabled
-
-router = None
-if enable_smart_routing:
-    router = PipeRouter(grid_size=10)
-    for comp in components.values():
-        router.add_component_obstacle(comp.x, comp.y, comp.width, comp.height, padding=20)
-
-pipes = [ProfessionalPnidPipe(row, components, router) for _, row in st.session_state.pipe_df.iterrows()]
+eq_sig, pipe_sig = get_data_signature()
+eq_sig = (eq_sig, tuple(tuple(row.items()) for row in pending_components))
+components = build_components(eq_sig, st.session_state.eq_df, SYMBOL_SCALE, pending_components)
+pipes = build_pipes(pipe_sig, st.session_state.pipe_df, eq_sig, st.session_state.eq_df,
+                    SYMBOL_SCALE, enable_smart_routing, pending_components)
+geometry_sig = (eq_sig, pipe_sig, SYMBOL_SCALE, enable_smart_routing)
+analyzer = get_analyzer(geometry_sig, components, pipes)
 
 # Main display
 
@@ -692,8 +1096,7 @@ with col2:
 
 with col3:
     if st.button("✅ Validate", use_container_width=True):
-        validator = PnIDValidator(components, pipes)
-        validation = validator.validate_all()
+        validation = session_validation(eq_sig, pipe_sig, components, pipes, analyzer)
         if validation['is_valid']:
             st.success("P&ID validation passed!")
         else:
@@ -701,7 +1104,6 @@ with col3:
 
 with col4:
     if st.button("📊 Analyze", use_container_width=True):
-        analyzer = ControlSystemAnalyzer(components, pipes)
         st.info(f"Found {len(analyzer.control_loops)} control loops")
 
 with col5:
@@ -710,8 +1112,24 @@ with col5:
 # Main P&ID display
 
 st.markdown('<div class="pnid-container">', unsafe_allow_html=True)
-svg_output = render_final_professional_pnid(components, pipes, st.session_state.project_info)
-st.components.v1.html(svg_output, height=800, scrolling=True)
+svg_bytes = render_svg(
+    geometry_sig, components, pipes, st.session_state.project_info, drawing_size,
+    st.session_state.visual_sig, enable_3d_symbols
+)
+svg_key = svg_digest(svg_bytes)
+
+# Display as a raster image: browser cost scales with resolution rather than
+# SVG element count. The SVG bytes are kept for export.
+# Only rasterizer failures fall back: no backend installed (ImportError),
+# libcairo missing (OSError) or a document the renderer rejects (ValueError).
+display_width = min(2000, DRAWING_SIZES[drawing_size][0] * 10)
+try:
+    png_bytes = rasterize_svg(svg_key, svg_bytes, display_width)
+except (ImportError, OSError, ValueError) as e:
+    st.caption(f"PNG preview unavailable ({e}), showing SVG")
+    st.components.v1.html(svg_bytes.decode('utf-8'), height=800, scrolling=True)
+else:
+    st.image(png_bytes, width="stretch")
 st.markdown('</div>', unsafe_allow_html=True)
 
 # Metrics row
@@ -719,25 +1137,30 @@ st.markdown('</div>', unsafe_allow_html=True)
 st.markdown("---")
 col1, col2, col3, col4, col5, col6 = st.columns(6)
 
+stats = drawing_stats(eq_sig, pipe_sig, components, pipes)
+
 with col1:
-    st.metric("Equipment", len([c for c in components.values() if not c.is_instrument]))
+    st.metric("Equipment", stats['equipment'])
 with col2:
-    st.metric("Instruments", len([c for c in components.values() if c.is_instrument]))
+    st.metric("Instruments", stats['instruments'])
 with col3:
-    st.metric("Pipes", len(pipes))
+    st.metric("Pipes", stats['pipes'])
 with col4:
-    st.metric("Valves", len([c for c in components.values() if 'valve' in c.component_type]))
+    st.metric("Valves", stats['valves'])
 with col5:
-    analyzer = ControlSystemAnalyzer(components, pipes)
     st.metric("Control Loops", len(analyzer.control_loops))
 with col6:
-    st.metric("Line Numbers", len(set(p.label for p in pipes if p.label)))
+    st.metric("Line Numbers", stats['line_numbers'])
 
 # Tabs for different functions
 
 tab1, tab2, tab3, tab4 = st.tabs(["📝 Edit", "🔧 Components", "📊 Analysis", "📁 Data"])
 
-with tab1:
+# Interactive tabs run as fragments, so typing in the Edit form, browsing the
+# library or generating a PNG reruns only that tab, not the whole drawing.
+
+@fragment
+def edit_tab():
     # Component addition
     st.markdown("### Add Component")
     col1, col2, col3 = st.columns(3)
@@ -756,7 +1179,9 @@ with tab1:
         new_y = st.number_input("Y Position", 0, 2000, 300, 25)
 
     if st.button("Add Component", type="primary"):
-        if new_id and new_id not in st.session_state.eq_df['id'].values:
+        pending = st.session_state.pending_components
+        if new_id and new_id not in st.session_state.eq_df['id'].values \
+                and all(row['id'] != new_id for row in pending):
             new_row = {
                 'id': new_id,
                 'tag': new_tag or new_id,
@@ -768,11 +1193,39 @@ with tab1:
                 'rotation': 0,
                 'size': new_size
             }
-            st.session_state.eq_df = pd.concat([st.session_state.eq_df, pd.DataFrame([new_row])], ignore_index=True)
+            pending.append(new_row)
             st.success(f"Added {new_type}: {new_tag}")
             st.rerun()
 
-with tab2:
+    # Pending additions are drawn already; Commit writes them into the equipment data
+    if st.session_state.pending_components:
+        count = len(st.session_state.pending_components)
+        st.caption(f"{count} added component(s) not yet committed to the equipment data")
+        if st.button("Commit", key="commit_components"):
+            st.session_state.eq_df = pd.concat(
+                [st.session_state.eq_df, pd.DataFrame(st.session_state.pending_components)],
+                ignore_index=True
+            )
+            st.session_state.pending_components.clear()
+            st.session_state.data_version += 1
+            st.rerun()
+
+
+@st.cache_data(show_spinner=False)
+def symbol_previews_html(symbol_types):
+    """Four-column grid of symbol previews with captions, as one HTML block"""
+    cells = []
+    for symbol_type in symbol_types:
+        if symbol_type in PROFESSIONAL_ISA_SYMBOLS:
+            cells.append(
+                f'<div><svg width="100" height="100" viewBox="0 0 100 100">{PROFESSIONAL_ISA_SYMBOLS[symbol_type]}</svg>'
+                f'<p style="font-size: 0.875rem; color: #666;">{symbol_type.replace("_", " ").title()}</p></div>'
+            )
+    return f'<div style="display: grid; grid-template-columns: repeat(4, 1fr); gap: 1rem;">{"".join(cells)}</div>'
+
+
+@fragment
+def component_library_tab():
     # Component library browser
     st.markdown("### Component Library")
 
@@ -790,43 +1243,52 @@ with tab2:
     selected_category = st.selectbox("Category", list(categories.keys()))
 
     # Display symbols in grid
-    cols = st.columns(4)
-    for i, symbol_type in enumerate(categories.get(selected_category, [])):
-        with cols[i % 4]:
-            if symbol_type in PROFESSIONAL_ISA_SYMBOLS:
-                # Display symbol preview
-                preview_svg = f'<svg width="100" height="100" viewBox="0 0 100 100">{PROFESSIONAL_ISA_SYMBOLS[symbol_type]}</svg>'
-                st.markdown(preview_svg, unsafe_allow_html=True)
-                st.caption(symbol_type.replace('_', ' ').title())
+    st.markdown(symbol_previews_html(tuple(categories.get(selected_category, []))), unsafe_allow_html=True)
 
-with tab3:
-    # Analysis results
-    st.markdown("### P&ID Analysis")
 
-    # Control systems
-    analyzer = ControlSystemAnalyzer(components, pipes)
-
-    if analyzer.control_loops:
-        st.markdown("#### Control Loops")
-        for loop in analyzer.control_loops:
-            st.write(f"- **{loop.loop_type.value}** ({loop.loop_id}): "
-                    f"{loop.primary_element} → {loop.controller} → {loop.final_element}")
-
-    # Validation
-    validator = PnIDValidator(components, pipes)
-    validation = validator.validate_all()
-
-    if validation['errors']:
-        st.markdown("#### ❌ Errors")
-        for error in validation['errors']:
-            st.error(error)
-
-    if validation['warnings']:
-        st.markdown("#### ⚠️ Warnings")
-        for warning in validation['warnings']:
-            st.warning(warning)
-
-with tab4:
+def show_table(df, key, interactive_rows=50, max_rows=500):
+    """
+    Static st.table for small frames, the interactive grid for larger ones, and
+    a max_rows window with a row slider beyond that so only the visible slice is
+    serialized to the browser.
+    """
+    if len(df) <= interactive_rows:
+        st.table(df)
+    elif len(df) <= max_rows:
+        st.dataframe(df, use_container_width=True)
+    else:
+        start = st.slider("First row", 0, len(df) - max_rows, 0, step=1, key=f"{key}_start")
+        st.caption(f"Rows {start + 1}-{start + max_rows} of {len(df)}")
+        st.dataframe(df.iloc[start:start + max_rows], use_container_width=True)
+
+
+def download_data(data):
+    """st.download_button payload, deferred until clicked where supported"""
+    return (lambda: data) if DEFERRED_DOWNLOADS else data
+
+
+@fragment
+def png_export(svg_key, svg_bytes):
+    # Own fragment so generating the PNG doesn't re-send the data tables below
+    # Raster cost scales with pixel count, so default well below print width
+    png_width = st.select_slider("PNG width", [1000, 1500, 2000, 3000], value=1500, key="png_width")
+    if st.button("Generate PNG", use_container_width=True):
+        try:
+            with st.spinner("Rendering PNG..."):
+                png_data = rasterize_svg(svg_key, svg_bytes, png_width)
+            st.download_button(
+                "📥 Download PNG",
+                download_data(png_data),
+                "professional_pnid.png",
+                "image/png",
+                use_container_width=True
+            )
+        except Exception as e:
+            st.error(f"PNG generation error: {e}")
+
+
+@fragment
+def data_tab(svg_key, svg_bytes):
     # Data management
     st.markdown("### Data Management")
 
@@ -836,41 +1298,54 @@ with tab4:
     with col1:
         st.download_button(
             "📥 Download SVG",
-            svg_output,
+            download_data(svg_bytes),
             "professional_pnid.svg",
             "image/svg+xml",
             use_container_width=True
         )
 
     with col2:
-        if st.button("Generate PNG", use_container_width=True):
-            try:
-                png_data = svg2png(bytestring=svg_output.encode('utf-8'), output_width=3000)
-                st.download_button(
-                    "📥 Download PNG",
-                    png_data,
-                    "professional_pnid.png",
-                    "image/png",
-                    use_container_width=True
-                )
-            except Exception as e:
-                st.error(f"PNG generation error: {e}")
+        png_export(svg_key, svg_bytes)
 
     # Data tables
     with st.expander("Equipment Data"):
-        st.dataframe(st.session_state.eq_df, use_container_width=True)
+        show_table(st.session_state.eq_df, "eq_table")
 
     with st.expander("Pipe Data"):
-        st.dataframe(st.session_state.pipe_df, use_container_width=True)
+        show_table(st.session_state.pipe_df, "pipe_table")
+
+
+with tab1:
+    edit_tab()
+
+with tab2:
+    component_library_tab()
+
+with tab3:
+    # Analysis results
+    st.markdown("### P&ID Analysis")
+
+    # Control systems
+    if analyzer.control_loops:
+        st.markdown("#### Control Loops")
+        st.markdown(loop_summary(geometry_sig, analyzer.control_loops))
+
+    # Validation
+    validation = session_validation(eq_sig, pipe_sig, components, pipes, analyzer)
+
+    # One alert per list rather than one per message
+    if validation['errors']:
+        st.markdown("#### ❌ Errors")
+        st.error("\n".join(f"- {error}" for error in validation['errors']))
+
+    if validation['warnings']:
+        st.markdown("#### ⚠️ Warnings")
+        st.warning("\n".join(f"- {warning}" for warning in validation['warnings']))
+
+with tab4:
+    data_tab(svg_key, svg_bytes)
 
 # Footer
 
 st.markdown("---")
-st.markdown(
-    """
-    <div style="text-align: center; color: #666;">
-    <p>EPS Professional P&ID Generator v2.0 | © 2024 EPS Pvt. Ltd. | ISO 15926 Compliant</p>
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
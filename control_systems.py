@@ -6,10 +6,25 @@ Includes control loops, interlocks, routing algorithms, and validation
 import re
 import math
 import heapq
-from typing import List, Tuple, Dict, Set, Optional
+import itertools
+import threading
+from functools import lru_cache
+from typing import List, Tuple, Dict, Set, Optional, NamedTuple
+from collections import OrderedDict
 import numpy as np
+import pandas as pd
 from dataclasses import dataclass
 from enum import Enum
+import geometry_kernels
+from professional_symbols import fmt_coord
+
+# Precompiled patterns
+
+_INSTRUMENT_TAG_RE = re.compile(r'^([A-Z])([A-Z]*)-?(\d+)$')  # variable, modifiers, loop number
+_VALIDATE_TAG_RE = re.compile(r'^([A-Z]{2,4})-?(\d{3,4})([A-Z]?)$')  # ISA tag format
+_TAG_FALLBACK_RE = re.compile(r'^([A-Z]+)-?(\d+)([A-Z]?)$')  # any letters-number tag
+_LINE_SIZE_RE = re.compile(r'^(\d+)"?-([A-Z]+)-(\d+)')  # e.g. 2"-PG-101
+_SHUTDOWN_RE = re.compile(r'SDV|XV|(?i:trip)')  # shutdown valve or trip system tag
 
 # — CONTROL LOOP DETECTION AND VISUALIZATION —
 
@@ -22,7 +37,7 @@ class LoopType(Enum):
     RATIO = "Ratio Control"
     FEEDFORWARD = "Feedforward Control"
 
-@dataclass
+@dataclass(slots=True)
 class ControlLoop:
     """Represents a control loop in the P&ID"""
     loop_id: str
@@ -39,6 +54,17 @@ class ControlLoop:
             if self.setpoint_source:
                 self.components.append(self.setpoint_source)
 
+class InstrumentFunction(NamedTuple):
+    """Parsed instrument tag; immutable so cached parses can be shared"""
+    variable: str
+    modifiers: str
+    number: str
+    is_controller: bool
+    is_transmitter: bool
+    is_valve: bool
+    is_indicator: bool
+    is_alarm: bool
+
 class ControlSystemAnalyzer:
     """Analyzes P&ID for control loops and interlocks"""
 
@@ -49,17 +75,27 @@ class ControlSystemAnalyzer:
         self.interlocks = []
         # --- FIX START ---
         # Add the preprocessing step here to populate tag_info
-        self._preprocess_components()
+        preprocess_components(self.components)
         # --- FIX END ---
+        # Pipe endpoints as parallel arrays ('' where an end is unconnected)
+        self._pipe_from = np.array([p.from_comp.id if p.from_comp else '' for p in self.pipes], dtype=object)
+        self._pipe_to = np.array([p.to_comp.id if p.to_comp else '' for p in self.pipes], dtype=object)
+        self._pipe_is_instr = np.array(
+            [p.line_type == 'instrumentation' and bool(p.from_comp) and bool(p.to_comp) for p in self.pipes],
+            dtype=bool,
+        )
+        self._instrument_adjacency = self._build_instrument_adjacency()
+        self._group_of = self._label_instrument_groups()
         self._analyze_control_systems()
 
     # --- FIX START ---
     @staticmethod # Make it a static method
-    def _parse_instrument_function(tag: str) -> Optional[Dict]: # Add type hints for clarity
-        """Parse instrument tag to determine function"""
-        match = re.match(r'^([A-Z])([A-Z]*)[-]?(\d+)$', tag)
+    @lru_cache(maxsize=4096)
+    def _parse_instrument_function(tag: str) -> Optional[InstrumentFunction]:
+        """Parse instrument tag to determine function (memoized per tag string)"""
+        match = _INSTRUMENT_TAG_RE.match(tag)
         if not match:
-            return None # Return None if no match, consistent with Optional[Dict]
+            return None # Return None if no match, consistent with Optional[InstrumentFunction]
         
         variable = match.group(1)
         modifiers = match.group(2)
@@ -72,45 +108,48 @@ class ControlSystemAnalyzer:
         is_indicator = 'I' in modifiers
         is_alarm = 'A' in modifiers or 'H' in modifiers or 'L' in modifiers
         
-        return {
-            'variable': variable,
-            'modifiers': modifiers,
-            'number': number,
-            'is_controller': is_controller,
-            'is_transmitter': is_transmitter,
-            'is_valve': is_valve,
-            'is_indicator': is_indicator,
-            'is_alarm': is_alarm
-        }
-
-    def _preprocess_components(self):
-        """
-        Parses instrument tags and stores the parsed info in a 'tag_info'
-        attribute on each ProfessionalPnidComponent object. This runs once
-        when ControlSystemAnalyzer is initialized.
-        """
-        for comp_id, comp in self.components.items():
-            # Check if it's an instrument and has a tag before attempting to parse
-            if hasattr(comp, 'is_instrument') and comp.is_instrument and hasattr(comp, 'tag'):
-                # Assuming comp is a mutable object where you can add attributes dynamically
-                comp.tag_info = ControlSystemAnalyzer._parse_instrument_function(comp.tag)
-            else:
-                # Ensure tag_info exists even if it's None, to prevent AttributeError later
-                # Only set if it doesn't already exist or if it's not an instrument
-                if not hasattr(comp, 'tag_info') or not comp.is_instrument:
-                    comp.tag_info = None
-    # --- FIX END ---
+        return InstrumentFunction(
+            variable=variable,
+            modifiers=modifiers,
+            number=number,
+            is_controller=is_controller,
+            is_transmitter=is_transmitter,
+            is_valve=is_valve,
+            is_indicator=is_indicator,
+            is_alarm=is_alarm
+        )
+
+    def _build_instrument_adjacency(self):
+        """Map component id -> ids joined to it by instrument signal lines, in pipe order"""
+        adjacency = {}
+        rows = np.flatnonzero(self._pipe_is_instr)
+        for from_id, to_id in zip(self._pipe_from[rows].tolist(), self._pipe_to[rows].tolist()):
+            adjacency.setdefault(from_id, []).append(to_id)
+            if to_id != from_id:
+                adjacency.setdefault(to_id, []).append(from_id)
+        return adjacency
+
+    def _label_instrument_groups(self):
+        """Connected-component label (a member id) for every id in the instrument signal graph"""
+        adjacency = self._instrument_adjacency
+        labels = {}
+        for root in adjacency:
+            if root in labels:
+                continue
+            labels[root] = root
+            queue = [root]
+            for node in queue:  # Breadth-first; the queue grows while it is walked
+                for neighbor in adjacency[node]:
+                    if neighbor not in labels:
+                        labels[neighbor] = root
+                        queue.append(neighbor)
+            if len(labels) == len(adjacency):
+                break  # Every node seen; no need to visit the remaining roots
+        return labels
 
     def _find_connected_instruments(self, component_id):
         """Find all instruments connected via instrument signals"""
-        connected = []
-        for pipe in self.pipes:
-            if pipe.line_type == 'instrumentation':
-                if pipe.from_comp and pipe.from_comp.id == component_id:
-                    connected.append(pipe.to_comp.id)
-                elif pipe.to_comp and pipe.to_comp.id == component_id:
-                    connected.append(pipe.from_comp.id)
-        return connected
+        return self._instrument_adjacency.get(component_id, ())
 
     def _analyze_control_systems(self):
         """Analyze the P&ID to identify control loops"""
@@ -119,51 +158,58 @@ class ControlSystemAnalyzer:
         transmitters = {}
         control_valves = {}
         alarms = {}
+        valve_ids = set()
+        components = self.components
         
-        for comp_id, comp in self.components.items():
+        for comp_id, comp in components.items():
+            if 'valve' in comp.component_type:
+                valve_ids.add(comp_id)
             # --- FIX START ---
-            # Now, comp.tag_info should exist because of _preprocess_components()
+            # Now, comp.tag_info should exist because of preprocess_components()
             if comp.is_instrument and comp.tag_info: # Directly check comp.tag_info
                 tag_analysis = comp.tag_info # Use the pre-parsed info
             # --- FIX END ---
                 if tag_analysis: # Check if parsing was successful
-                    if tag_analysis['is_controller']:
+                    if tag_analysis.is_controller:
                         controllers[comp_id] = (comp, tag_analysis)
-                    elif tag_analysis['is_transmitter']:
+                    elif tag_analysis.is_transmitter:
                         transmitters[comp_id] = (comp, tag_analysis)
-                    elif tag_analysis['is_valve']:
+                    elif tag_analysis.is_valve:
                         control_valves[comp_id] = (comp, tag_analysis)
-                    elif tag_analysis['is_alarm']:
+                    elif tag_analysis.is_alarm:
                         alarms[comp_id] = (comp, tag_analysis)
         
+        # Transmitters by (variable, loop number), so a controller finds its
+        # candidates with one lookup instead of comparing every neighbor
+        transmitters_by_loop = {}
+        for trans_id, (_, trans_info) in transmitters.items():
+            transmitters_by_loop.setdefault((trans_info.variable, trans_info.number), set()).add(trans_id)
+
+        # Loops are local to a connected group of instruments: only controllers
+        # whose group contains a transmitter can close one
+        groups_with_transmitter = {self._group_of[t] for t in transmitters if t in self._group_of}
+
         # Identify control loops
         for controller_id, (controller, controller_info) in controllers.items():
-            # Find connected transmitter
+            if self._group_of.get(controller_id) not in groups_with_transmitter:
+                continue
+            candidates = transmitters_by_loop.get((controller_info.variable, controller_info.number))
+            if not candidates:
+                continue
+
             connected = self._find_connected_instruments(controller_id)
-            
-            transmitter_id = None
-            final_element_id = None
-            
-            for conn_id in connected:
-                if conn_id in transmitters:
-                    trans_info = transmitters[conn_id][1]
-                    # Check if same variable type and loop number
-                    if (trans_info['variable'] == controller_info['variable'] and 
-                        trans_info['number'] == controller_info['number']):
-                        transmitter_id = conn_id
-                
-                # Find control valve or regular valve
-                if conn_id in control_valves:
-                    final_element_id = conn_id
-                elif conn_id in self.components and 'valve' in self.components[conn_id].component_type:
-                    final_element_id = conn_id
+
+            # The last connected match wins for both the transmitter and the
+            # final element (control valve or regular valve)
+            transmitter_id = next((c for c in reversed(connected) if c in candidates), None)
+            final_element_id = next((c for c in reversed(connected) if c in control_valves or c in valve_ids), None)
             
             if transmitter_id and final_element_id:
                 # Determine loop type
-                loop_type = self._determine_loop_type(controller_info['variable'])
+                loop_type = self._determine_loop_type(controller_info.variable)
                 
                 loop = ControlLoop(
-                    loop_id=f"{controller_info['variable']}C-{controller_info['number']}",
+                    loop_id=f"{controller_info.variable}C-{controller_info.number}",
                     loop_type=loop_type,
                     primary_element=transmitter_id,
                     controller=controller_id,
@@ -172,18 +218,20 @@ class ControlSystemAnalyzer:
                 self.control_loops.append(loop)
         
         # Identify interlocks (alarms connected to shutdown systems)
+        if not alarms:
+            return
+        shutdown_ids = {comp_id for comp_id, comp in components.items()
+                        if isinstance(comp.tag, str) and _SHUTDOWN_RE.search(comp.tag)}
         for alarm_id, (alarm, alarm_info) in alarms.items():
             connected = self._find_connected_instruments(alarm_id)
             for conn_id in connected:
-                if conn_id in self.components:
-                    comp = self.components[conn_id]
-                    # Check if connected to shutdown valve or trip system
-                    if 'SDV' in comp.tag or 'XV' in comp.tag or 'trip' in comp.tag.lower():
-                        self.interlocks.append({
-                            'alarm': alarm_id,
-                            'action': conn_id,
-                            'type': 'Safety Interlock'
-                        })
+                # Check if connected to shutdown valve or trip system
+                if conn_id in shutdown_ids:
+                    self.interlocks.append({
+                        'alarm': alarm_id,
+                        'action': conn_id,
+                        'type': 'Safety Interlock'
+                    })
 
     def _determine_loop_type(self, variable):
         """Determine control loop type from variable letter"""
@@ -197,46 +245,53 @@ class ControlSystemAnalyzer:
 
     def generate_control_loop_svg(self, loop: ControlLoop, scale=1.0):
         """Generate SVG representation of a control loop"""
-        svg = f'<g class="control-loop-{loop.loop_id}" opacity="0.8">'
-        
         # Draw dashed box around loop components
         # This is simplified - in real implementation, calculate bounding box
-        svg += f'<rect x="100" y="100" width="400" height="300" fill="none" stroke="blue" stroke-width="2" stroke-dasharray="5,5" rx="10"/>'
-        svg += f'<text x="110" y="120" font-size="14" fill="blue" font-weight="bold">{loop.loop_type.value} Loop {loop.loop_id}</text>'
-        
-        svg += '</g>'
-        return svg
+        return (
+            f'<g class="control-loop-{loop.loop_id}" opacity="0.8">'
+            '<rect x="100" y="100" width="400" height="300" fill="none" stroke="blue" stroke-width="2" stroke-dasharray="5,5" rx="10"/>'
+            f'<text x="110" y="120" font-size="14" fill="blue" font-weight="bold">{loop.loop_type.value} Loop {loop.loop_id}</text>'
+            '</g>'
+        )
+
+def preprocess_components(components):
+    """
+    Parses instrument tags and stores the parsed info in a 'tag_info'
+    attribute on each ProfessionalPnidComponent object. Called by
+    ControlSystemAnalyzer and PnIDValidator before they read tag_info.
+    """
+    for comp_id, comp in components.items():
+        # Check if it's an instrument and has a tag before attempting to parse
+        if hasattr(comp, 'is_instrument') and comp.is_instrument and hasattr(comp, 'tag'):
+            # Assuming comp is a mutable object where you can add attributes dynamically
+            comp.tag_info = ControlSystemAnalyzer._parse_instrument_function(comp.tag)
+        else:
+            # Ensure tag_info exists even if it's None, to prevent AttributeError later
+            # Only set if it doesn't already exist or if it's not an instrument
+            if not hasattr(comp, 'tag_info') or not comp.is_instrument:
+                comp.tag_info = None
 
 # — A* PATHFINDING FOR PIPE ROUTING —
 
-class GridNode:
-    """Node for A* pathfinding"""
-    def __init__(self, x, y, g=0, h=0, parent=None):
-        self.x = x
-        self.y = y
-        self.g = g  # Cost from start
-        self.h = h  # Heuristic to end
-        self.f = g + h  # Total cost
-        self.parent = parent
-
-    def __lt__(self, other):
-        return self.f < other.f
-
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-
-    def __hash__(self):
-        return hash((self.x, self.y))
-
 class PipeRouter:
     """Advanced pipe routing with A* algorithm and collision detection"""
 
+    DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))  # N, E, S, W
+    PATH_CACHE_SIZE = 1024  # Routes kept by find_path
+
     def __init__(self, grid_size=10, width=2000, height=1500):
         self.grid_size = grid_size
         self.width = width
         self.height = height
-        self.obstacles = set()  # Grid cells occupied by components
-        self.pipes_grid = set()  # Grid cells occupied by existing pipes
+        # Cell bitmaps indexed [gx, gy]; one extra row/column holds the clamped
+        # far edge of obstacles, which lies outside the routable area
+        shape = (width // grid_size + 1, height // grid_size + 1)
+        self.obstacles = np.zeros(shape, dtype=bool)  # Grid cells occupied by components
+        self.pipes_grid = np.zeros(shape, dtype=bool)  # Grid cells occupied by existing pipes
+        # Routes found so far, keyed by (start, end, prefer_straight, obstacle version)
+        self._obstacle_version = 0
+        self._path_cache = OrderedDict()
+        self._path_cache_lock = threading.Lock()  # Routers are shared across script threads
 
     def add_component_obstacle(self, x, y, width, height, padding=20):
         """Add component as obstacle with padding"""
@@ -245,168 +300,201 @@ class PipeRouter:
         end_x = min(self.width // self.grid_size, int((x + width + padding) / self.grid_size))
         end_y = min(self.height // self.grid_size, int((y + height + padding) / self.grid_size))
         
-        for gx in range(start_x, end_x + 1):
-            for gy in range(start_y, end_y + 1):
-                self.obstacles.add((gx, gy))
+        if start_x <= end_x and start_y <= end_y:
+            self.obstacles[start_x:end_x + 1, start_y:end_y + 1] = True
+        self._obstacle_version += 1
+
+    def add_obstacles(self, xs, ys, widths, heights, padding=20):
+        """Add many component obstacles at once from parallel coordinate arrays"""
+        xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+        widths, heights = np.asarray(widths, dtype=float), np.asarray(heights, dtype=float)
+        max_x, max_y = self.width // self.grid_size, self.height // self.grid_size
+
+        # Same cell bounds as add_component_obstacle (int() truncates toward zero)
+        start_x = np.maximum(0, np.trunc((xs - padding) / self.grid_size).astype(int))
+        start_y = np.maximum(0, np.trunc((ys - padding) / self.grid_size).astype(int))
+        end_x = np.minimum(max_x, np.trunc((xs + widths + padding) / self.grid_size).astype(int))
+        end_y = np.minimum(max_y, np.trunc((ys + heights + padding) / self.grid_size).astype(int))
+        valid = (start_x <= end_x) & (start_y <= end_y)
+        start_x, start_y, end_x, end_y = start_x[valid], start_y[valid], end_x[valid], end_y[valid]
+
+        # Rasterize all rectangles with a 2D difference array and prefix sums
+        coverage = np.zeros((max_x + 2, max_y + 2), dtype=np.int32)
+        np.add.at(coverage, (start_x, start_y), 1)
+        np.add.at(coverage, (end_x + 1, start_y), -1)
+        np.add.at(coverage, (start_x, end_y + 1), -1)
+        np.add.at(coverage, (end_x + 1, end_y + 1), 1)
+        coverage = coverage.cumsum(axis=0).cumsum(axis=1)
+
+        self.obstacles |= coverage[:max_x + 1, :max_y + 1] > 0
+        self._obstacle_version += 1
 
     def add_pipe_path(self, points):
         """Add existing pipe path to avoid crossings"""
-        for i in range(len(points) - 1):
-            p1, p2 = points[i], points[i + 1]
-            # Add all grid cells along the line
-            cells = self._bresenham_line(
+        if len(points) < 2:
+            return
+        # Add all grid cells along each segment
+        segments = [
+            self._bresenham_line(
                 int(p1[0] / self.grid_size), int(p1[1] / self.grid_size),
                 int(p2[0] / self.grid_size), int(p2[1] / self.grid_size)
             )
-            self.pipes_grid.update(cells)
+            for p1, p2 in zip(points[:-1], points[1:])
+        ]
+        xs = np.concatenate([seg[0] for seg in segments])
+        ys = np.concatenate([seg[1] for seg in segments])
+        inside = (xs >= 0) & (xs < self.pipes_grid.shape[0]) & (ys >= 0) & (ys < self.pipes_grid.shape[1])
+        self.pipes_grid[xs[inside], ys[inside]] = True
+        self._obstacle_version += 1
 
     def _bresenham_line(self, x0, y0, x1, y1):
-        """Get all grid cells along a line using Bresenham's algorithm"""
-        cells = []
+        """Get all grid cells along a line using Bresenham's algorithm, as (xs, ys) arrays"""
         dx = abs(x1 - x0)
         dy = abs(y1 - y0)
         sx = 1 if x0 < x1 else -1
         sy = 1 if y0 < y1 else -1
-        err = dx - dy
+        major = max(dx, dy)
+        steps = np.arange(major + 1)
         
-        while True:
-            cells.append((x0, y0))
-            if x0 == x1 and y0 == y1:
-                break
-            e2 = 2 * err
-            if e2 > -dy:
-                err -= dy
-                x0 += sx
-            if e2 < dx:
-                err += dx
-                y0 += sy
-        
-        return cells
-
-    def _heuristic(self, a, b):
-        """Manhattan distance heuristic favoring orthogonal paths"""
-        return abs(a[0] - b[0]) + abs(a[1] - b[1])
-
-    def _get_neighbors(self, node):
-        """Get valid neighboring nodes (4-directional for orthogonal paths)"""
-        neighbors = []
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # N, E, S, W
-        
-        for dx, dy in directions:
-            new_x = node.x + dx
-            new_y = node.y + dy
-            
-            # Check bounds
-            if (0 <= new_x < self.width // self.grid_size and 
-                0 <= new_y < self.height // self.grid_size):
-                
-                # Check obstacles
-                if (new_x, new_y) not in self.obstacles:
-                    # Add small penalty for crossing existing pipes
-                    cost = 1.0
-                    if (new_x, new_y) in self.pipes_grid:
-                        cost = 1.5  # Prefer not to cross but allow if necessary
-                    
-                    neighbors.append((new_x, new_y, cost))
-        
-        return neighbors
+        # One cell per step along the major axis; the error-term walk puts the
+        # minor axis at floor((2*i*minor + major - 1) / (2*major)) on step i
+        minor = (2 * steps * min(dx, dy) + major - 1) // (2 * major) if major else steps
+        x_steps, y_steps = (steps, minor) if dx >= dy else (minor, steps)
+        return x0 + sx * x_steps, y0 + sy * y_steps
 
     def find_path(self, start, end, prefer_straight=True):
-        """Find optimal path from start to end using A*"""
+        """Find optimal path from start to end using A* (memoized until obstacles change)"""
+        key = (tuple(start), tuple(end), prefer_straight, self._obstacle_version)
+        with self._path_cache_lock:
+            path = self._path_cache.get(key)
+            if path is not None:
+                self._path_cache.move_to_end(key)
+        if path is None:
+            path = self._find_path(start, end, prefer_straight)
+            with self._path_cache_lock:
+                self._path_cache[key] = path
+                if len(self._path_cache) > self.PATH_CACHE_SIZE:
+                    self._path_cache.popitem(last=False)
+        return list(path)  # Callers own their copy
+
+    def _find_path(self, start, end, prefer_straight):
+        """A* search from start to end"""
         # Convert to grid coordinates
         start_grid = (int(start[0] / self.grid_size), int(start[1] / self.grid_size))
         end_grid = (int(end[0] / self.grid_size), int(end[1] / self.grid_size))
-        
-        # Initialize A*
-        open_set = []
-        closed_set = set()
-        
-        # Fix: The parent of the start_node should be None, not 'current'
-        start_node = GridNode(start_grid[0], start_grid[1], 0, 
-                     self._heuristic(start_grid, end_grid), None)
 
-        heapq.heappush(open_set, start_node)
+        if geometry_kernels.NUMBA_AVAILABLE:
+            # Same search compiled over array grids (identical expansion order)
+            routable = (slice(0, self.width // self.grid_size), slice(0, self.height // self.grid_size))
+            cells = geometry_kernels.astar_grid(
+                self.obstacles[routable], self.pipes_grid[routable], start_grid, end_grid, prefer_straight
+            )
+            if cells is None:
+                return self._fallback_path(start, end)
+            path = [(x * self.grid_size, y * self.grid_size) for x, y in cells.tolist()]
+            return self._finish_path(path, start, end, prefer_straight)
+        
+        # Search state lives in flat arrays indexed by cell id x * rows + y;
+        # a start outside the grid takes the one extra id at the end
+        cols, rows = self.width // self.grid_size, self.height // self.grid_size
+        n_cells = cols * rows
+        blocked = self.obstacles[:cols, :rows].ravel().tolist()
+        crossing = self.pipes_grid[:cols, :rows].ravel().tolist()
+        sx, sy = start_grid
+        ex, ey = end_grid
+        start_id = sx * rows + sy if 0 <= sx < cols and 0 <= sy < rows else n_cells
+        
+        closed = bytearray(n_cells + 1)
+        best_g = [math.inf] * (n_cells + 1)
+        parents = [-1] * (n_cells + 1)
+        headings = [-1] * (n_cells + 1)  # Index into DIRECTIONS of the step into each cell
+        best_g[start_id] = 0
+        
+        # Heap entries are (f, push order, cell id), so ties pop
+        # first-in-first-out and comparisons stay in C
+        counter = itertools.count()
+        open_set = [(abs(sx - ex) + abs(sy - ey), next(counter), start_id)]
         
         while open_set:
-            current = heapq.heappop(open_set)
+            _, _, current = heapq.heappop(open_set)
+            if closed[current]:
+                continue  # Stale entry, superseded by a cheaper push
+            cx, cy = divmod(current, rows) if current < n_cells else start_grid
             
             # Check if reached goal
-            if (current.x, current.y) == end_grid:
+            if cx == ex and cy == ey:
                 # Reconstruct path
-                path = []
-                while current:
-                    path.append((current.x * self.grid_size, current.y * self.grid_size))
-                    current = current.parent
-                path.reverse()
-                
-                # Smooth path to minimize bends
-                if prefer_straight:
-                    path = self._smooth_path(path)
-                
-                # Ensure exact start and end points
-                path[0] = start
-                path[-1] = end
-                
-                return path
+                cells = []
+                while current != start_id:
+                    cells.append(divmod(current, rows))
+                    current = parents[current]
+                cells.append(start_grid)
+                cells.reverse()
+                path = [(x * self.grid_size, y * self.grid_size) for x, y in cells]
+                return self._finish_path(path, start, end, prefer_straight)
             
-            closed_set.add((current.x, current.y))
+            closed[current] = 1
+            g = best_g[current]
+            heading = headings[current]
             
-            # Explore neighbors
-            for nx, ny, cost in self._get_neighbors(current):
-                if (nx, ny) in closed_set:
+            # Explore the 4-directional neighbors
+            for direction, (dx, dy) in enumerate(self.DIRECTIONS):
+                nx = cx + dx
+                ny = cy + dy
+                if not (0 <= nx < cols and 0 <= ny < rows):
+                    continue
+                neighbor = nx * rows + ny
+                if blocked[neighbor] or closed[neighbor]:
                     continue
                 
-                # Calculate costs
-                tentative_g = current.g + cost
+                # Crossing an existing pipe is allowed but costs more
+                tentative_g = g + (1.5 if crossing[neighbor] else 1.0)
                 
                 # Add penalty for direction changes to prefer straight paths
-                if prefer_straight and current.parent:
-                    dx1 = current.x - current.parent.x
-                    dy1 = current.y - current.parent.y
-                    dx2 = nx - current.x
-                    dy2 = ny - current.y
-                    
-                    if (dx1, dy1) != (dx2, dy2):  # Direction change
-                        tentative_g += 0.5
-                
-                # Check if this path is better
-                neighbor = GridNode(nx, ny, tentative_g, 
-                                  self._heuristic((nx, ny), end_grid), current)
+                if prefer_straight and heading >= 0 and direction != heading:
+                    tentative_g += 0.5
                 
-                # Add to open set
-                heapq.heappush(open_set, neighbor)
+                # Only keep pushes that improve on the best known cost
+                if tentative_g >= best_g[neighbor]:
+                    continue
+                best_g[neighbor] = tentative_g
+                parents[neighbor] = current
+                headings[neighbor] = direction
+                heapq.heappush(open_set, (tentative_g + abs(nx - ex) + abs(ny - ey), next(counter), neighbor))
         
         # No path found - return direct line
         return self._fallback_path(start, end)
 
+    def _finish_path(self, path, start, end, prefer_straight):
+        """Turn a grid path into drawing coordinates ending exactly at start and end"""
+        # Smooth path to minimize bends
+        if prefer_straight:
+            path = self._smooth_path(path)
+        
+        # Ensure exact start and end points
+        path[0] = start
+        path[-1] = end
+        
+        return path
+
     def _smooth_path(self, path):
-        """Remove unnecessary waypoints to create cleaner paths"""
+        """Remove unnecessary waypoints: keep the ends and every corner, in one pass"""
         if len(path) <= 2:
             return path
         
         smoothed = [path[0]]
-        
-        i = 0
-        while i < len(path) - 1:
-            # Look ahead to find furthest point we can reach in straight line
-            j = i + 1
-            while j < len(path):
-                # Check if all points between i and j are collinear
-                if self._are_collinear(path[i], path[j]):
-                    j += 1
-                else:
-                    break
-            
-            # Add the furthest reachable point
-            smoothed.append(path[j - 1])
-            i = j - 1
+        direction = None
+        for (x0, y0), (x1, y1) in zip(path, path[1:]):
+            step = ((x1 > x0) - (x1 < x0), (y1 > y0) - (y1 < y0))
+            if step == (0, 0):
+                continue  # Repeated point
+            if direction is not None and step != direction:
+                smoothed.append((x0, y0))  # Corner
+            direction = step
+        smoothed.append(path[-1])
         
         return smoothed
 
-    def _are_collinear(self, p1, p2):
-        """Check if two points can be connected with straight horizontal or vertical line"""
-        return p1[0] == p2[0] or p1[1] == p2[1]
-
     def _fallback_path(self, start, end):
         """Simple orthogonal path when A* fails"""
         mid_x = (start[0] + end[0]) / 2
@@ -414,158 +502,154 @@ class PipeRouter:
 
 # — INDUSTRY TEMPLATES —
 
+# Template layouts as (id, type, dx, dy, width, height) relative to the
+# template origin; ids are formatted with p=tag_prefix and n=tag_prefix[1:]
+_DISTILLATION_COMPONENTS = (
+    ('{p}-001', 'vessel', 0, 0, 80, 200),             # Main column
+    ('E-{n}1', 'heat_exchanger', 120, 150, 80, 60),   # Reboiler
+    ('E-{n}2', 'heat_exchanger', 120, -50, 80, 60),   # Condenser
+    ('V-{n}1', 'vessel', 250, -30, 60, 40),           # Reflux drum
+    # Standard instrumentation
+    ('TT-{n}01', 'instrument', -50, 50, 44, 44),
+    ('PT-{n}01', 'instrument', -50, 20, 44, 44),
+    ('LT-{n}01', 'instrument', 90, 180, 44, 44),
+    ('FT-{n}01', 'instrument', 40, 220, 44, 44),
+)
+
+# (from, from_port, to, to_port), ids formatted as above
+_DISTILLATION_PIPES = (
+    ('{p}-001', 'bottom', 'E-{n}1', 'inlet'),
+    ('E-{n}1', 'outlet', '{p}-001', 'side_bottom'),
+    ('{p}-001', 'top', 'E-{n}2', 'inlet'),
+    ('E-{n}2', 'outlet', 'V-{n}1', 'inlet'),
+)
+
+_REDUNDANT_PUMP_COMPONENTS = (
+    # Two pumps in parallel
+    ('{p}-001A', 'pump_centrifugal', 0, 0, 60, 60),
+    ('{p}-001B', 'pump_centrifugal', 0, 100, 60, 60),
+    # Isolation valves
+    ('V-001', 'valve_gate', -60, 20, 40, 40),
+    ('V-002', 'valve_gate', 80, 20, 40, 40),
+    ('V-003', 'valve_gate', -60, 120, 40, 40),
+    ('V-004', 'valve_gate', 80, 120, 40, 40),
+    # Check valves
+    ('V-005', 'valve_check', 140, 20, 40, 40),
+    ('V-006', 'valve_check', 140, 120, 40, 40),
+    # Instrumentation
+    ('PT-001', 'instrument', -100, 70, 44, 44),
+    ('PT-002', 'instrument', 220, 70, 44, 44),
+)
+
+def _place_components(layout, x, y, tag_prefix):
+    """Component dicts for a template layout placed at (x, y)"""
+    names = {'p': tag_prefix, 'n': tag_prefix[1:]}
+    components = []
+    for id_format, comp_type, dx, dy, width, height in layout:
+        comp_id = id_format.format_map(names)
+        components.append({
+            'id': comp_id, 'tag': comp_id, 'type': comp_type,
+            'x': x + dx, 'y': y + dy, 'width': width, 'height': height
+        })
+    return components
+
 class ProcessUnitTemplate:
     """Templates for common process units"""
 
     @staticmethod
     def distillation_column(x, y, tag_prefix="T"):
         """Create a distillation column with standard instrumentation"""
-        components = []
-        pipes = []
-        
-        # Main column
-        col_id = f"{tag_prefix}-001"
-        components.append({
-            'id': col_id,
-            'tag': col_id,
-            'type': 'vessel',
-            'x': x,
-            'y': y,
-            'width': 80,
-            'height': 200
-        })
-        
-        # Reboiler
-        reb_id = f"E-{tag_prefix[1:]}1"
-        components.append({
-            'id': reb_id,
-            'tag': reb_id,
-            'type': 'heat_exchanger',
-            'x': x + 120,
-            'y': y + 150,
-            'width': 80,
-            'height': 60
-        })
-        
-        # Condenser
-        cond_id = f"E-{tag_prefix[1:]}2"
-        components.append({
-            'id': cond_id,
-            'tag': cond_id,
-            'type': 'heat_exchanger',
-            'x': x + 120,
-            'y': y - 50,
-            'width': 80,
-            'height': 60
-        })
-        
-        # Reflux drum
-        drum_id = f"V-{tag_prefix[1:]}1"
-        components.append({
-            'id': drum_id,
-            'tag': drum_id,
-            'type': 'vessel',
-            'x': x + 250,
-            'y': y - 30,
-            'width': 60,
-            'height': 40
-        })
-        
-        # Standard instrumentation
-        instruments = [
-            {'id': f'TT-{tag_prefix[1:]}01', 'tag': f'TT-{tag_prefix[1:]}01', 'x': x - 50, 'y': y + 50},
-            {'id': f'PT-{tag_prefix[1:]}01', 'tag': f'PT-{tag_prefix[1:]}01', 'x': x - 50, 'y': y + 20},
-            {'id': f'LT-{tag_prefix[1:]}01', 'tag': f'LT-{tag_prefix[1:]}01', 'x': x + 90, 'y': y + 180},
-            {'id': f'FT-{tag_prefix[1:]}01', 'tag': f'FT-{tag_prefix[1:]}01', 'x': x + 40, 'y': y + 220},
+        names = {'p': tag_prefix, 'n': tag_prefix[1:]}
+        components = _place_components(_DISTILLATION_COMPONENTS, x, y, tag_prefix)
+        pipes = [
+            {'from': src.format_map(names), 'from_port': src_port, 'to': dst.format_map(names), 'to_port': dst_port}
+            for src, src_port, dst, dst_port in _DISTILLATION_PIPES
         ]
-        
-        for inst in instruments:
-            inst['type'] = 'instrument'
-            inst['width'] = 44
-            inst['height'] = 44
-            components.append(inst)
-        
-        # Connect with pipes
-        pipes.extend([
-            {'from': col_id, 'from_port': 'bottom', 'to': reb_id, 'to_port': 'inlet'},
-            {'from': reb_id, 'from_port': 'outlet', 'to': col_id, 'to_port': 'side_bottom'},
-            {'from': col_id, 'from_port': 'top', 'to': cond_id, 'to_port': 'inlet'},
-            {'from': cond_id, 'from_port': 'outlet', 'to': drum_id, 'to_port': 'inlet'},
-        ])
-        
         return components, pipes
 
     @staticmethod
     def pump_station(x, y, tag_prefix="P", redundant=True):
         """Create a pump station with optional redundancy"""
-        components = []
-        pipes = []
-        
-        if redundant:
-            # Two pumps in parallel
-            pump1_id = f"{tag_prefix}-001A"
-            pump2_id = f"{tag_prefix}-001B"
-            
-            components.extend([
-                {'id': pump1_id, 'tag': pump1_id, 'type': 'pump_centrifugal', 
-                 'x': x, 'y': y, 'width': 60, 'height': 60},
-                {'id': pump2_id, 'tag': pump2_id, 'type': 'pump_centrifugal', 
-                 'x': x, 'y': y + 100, 'width': 60, 'height': 60}
-            ])
-            
-            # Isolation valves
-            valves = [
-                {'id': 'V-001', 'x': x - 60, 'y': y + 20},
-                {'id': 'V-002', 'x': x + 80, 'y': y + 20},
-                {'id': 'V-003', 'x': x - 60, 'y': y + 120},
-                {'id': 'V-004', 'x': x + 80, 'y': y + 120},
-            ]
-            
-            for v in valves:
-                v['tag'] = v['id']
-                v['type'] = 'valve_gate'
-                v['width'] = 40
-                v['height'] = 40
-                components.append(v)
-            
-            # Check valves
-            components.extend([
-                {'id': 'V-005', 'tag': 'V-005', 'type': 'valve_check',
-                 'x': x + 140, 'y': y + 20, 'width': 40, 'height': 40},
-                {'id': 'V-006', 'tag': 'V-006', 'type': 'valve_check',
-                 'x': x + 140, 'y': y + 120, 'width': 40, 'height': 40}
-            ])
-            
-            # Instrumentation
-            components.extend([
-                {'id': 'PT-001', 'tag': 'PT-001', 'type': 'instrument',
-                 'x': x - 100, 'y': y + 70, 'width': 44, 'height': 44},
-                {'id': 'PT-002', 'tag': 'PT-002', 'type': 'instrument',
-                 'x': x + 220, 'y': y + 70, 'width': 44, 'height': 44},
-            ])
-        
-        return components, pipes
+        components = _place_components(_REDUNDANT_PUMP_COMPONENTS, x, y, tag_prefix) if redundant else []
+        return components, []
 
 # — VALIDATION RULES —
 
+# Recognised instrument tag prefixes
+_VALID_PREFIXES = frozenset({
+    'F', 'P', 'T', 'L', 'A', 'V', 'E', 'I', 'S', 'Z',
+    'FT', 'PT', 'TT', 'LT', 'FI', 'PI', 'TI', 'LI',
+    'FC', 'PC', 'TC', 'LC', 'FIC', 'PIC', 'TIC', 'LIC',
+    'FV', 'PV', 'TV', 'LV', 'FCV', 'PCV', 'TCV', 'LCV',
+    'FAL', 'PAL', 'TAL', 'LAL', 'FAH', 'PAH', 'TAH', 'LAH',
+    # New prefixes from your warning list:
+    'SF', 'YS', 'CP', 'CPT', 'SCR', 'SIL', 'GV', 'PR', 'RM', 'LS', 'FS', 'FA', 'DP'
+})
+
+# Vessel ports that count as a standard inlet
+_VESSEL_INLET_PORTS = frozenset({'top', 'inlet', 'side_top', 'side_bottom'})
+
+# Per-tag and per-loop verdicts depend only on their (hashable) inputs, so they
+# are memoized at module level and shared by every validator instance.
+
+@lru_cache(maxsize=1024)
+def _check_instrument_tag(tag, parsed=None):
+    """
+    Check a single instrument tag. parsed is the analyzer's (prefix, number)
+    for the tag, or None to parse it here.
+    Returns (format_error, full_tag, prefix_warning); full_tag is None if the
+    tag cannot be parsed at all.
+    """
+    # A tag in the standard format is parsed by the same match that validates it
+    format_match = _VALIDATE_TAG_RE.match(tag)
+    format_error = None if format_match else f"Invalid instrument tag format: {tag}"
+
+    if parsed:
+        prefix, number = parsed
+        suffix = '' # The analyzer's regex only captures one suffix if present
+    else:
+        # Fallback to direct parsing if tag_info somehow wasn't populated
+        # (though preprocess_components should prevent this)
+        match = format_match or _TAG_FALLBACK_RE.match(tag)
+        if not match:
+            return format_error, None, None
+        prefix, number, suffix = match.groups()
+
+    full_tag = f"{prefix}-{number}{suffix}" if suffix else f"{prefix}-{number}"
+
+    # Check the full prefix (variable + modifiers)
+    prefix_warning = None
+    if prefix not in _VALID_PREFIXES:
+        prefix_warning = f"Non-standard instrument prefix: {prefix} in {tag}"
+    return format_error, full_tag, prefix_warning
+
+
+@lru_cache(maxsize=256)
+def _check_control_loop(loop_id, primary_element, final_element):
+    """Errors for a control loop missing required components"""
+    errors = ()
+    if not primary_element:
+        errors += (f"Control loop {loop_id} missing primary element",)
+    if not final_element:
+        errors += (f"Control loop {loop_id} missing final control element",)
+    return errors
+
 class PnIDValidator:
     """Validates P&ID against industry standards"""
 
-    def __init__(self, components, pipes):
+    def __init__(self, components, pipes, analyzer=None):
         self.components = components
         self.pipes = pipes
         self.errors = []
         self.warnings = []
-        # --- FIX START ---
-        # Ensure components have tag_info before validation, same as Analyzer
-        # Create a dummy analyzer to use its preprocessing for validation
-        temp_analyzer = ControlSystemAnalyzer(self.components, self.pipes)
-        # Note: If ControlSystemAnalyzer's _preprocess_components also does _analyze_control_systems,
-        # this will run that analysis too. For pure preprocessing, you might extract
-        # _preprocess_components to a shared utility or a dedicated preprocessor class.
-        # For now, it's fine as long as it correctly populates tag_info.
-        # This assumes self.components is a dictionary of mutable objects (like ProfessionalPnidComponent instances).
-        # --- FIX END ---
+        # An analyzer already built for these components has populated tag_info;
+        # without one, only the tag parsing is needed up front
+        self.analyzer = analyzer
+        if analyzer is None:
+            preprocess_components(self.components)
+        # Pressure vessels and tanks, selected once for the checks that need them
+        self._vessels = [c for c in self.components.values()
+                         if 'vessel' in c.component_type or 'tank' in c.component_type]
 
     def validate_all(self):
         """Run all validation checks"""
@@ -583,56 +667,29 @@ class PnIDValidator:
 
     def validate_instrument_tags(self):
         """Validate instrument tag format and consistency"""
-        tag_pattern = re.compile(r'^[A-Z]{2,4}[-]?\d{3,4}[A-Z]?$')
         tag_numbers = {}
         
         for comp_id, comp in self.components.items():
             if comp.is_instrument:
-                tag = comp.tag
-                
-                # Check format
-                if not tag_pattern.match(tag):
-                    self.errors.append(f"Invalid instrument tag format: {tag}")
-                
-                # Parse tag - USE THE PARSED TAG INFO IF AVAILABLE
-                # --- FIX START ---
-                # Use comp.tag_info directly, as it should be populated by now
-                tag_analysis = comp.tag_info 
+                tag_analysis = comp.tag_info
                 if tag_analysis:
-                    prefix = tag_analysis['variable'] + tag_analysis['modifiers']
-                    number = tag_analysis['number']
-                    suffix = '' # Your regex only captures one suffix if present
+                    parsed = (tag_analysis.variable + tag_analysis.modifiers, tag_analysis.number)
                 else:
-                    # Fallback to direct parsing if tag_info somehow wasn't populated
-                    # (though _preprocess_components should prevent this)
-                    match = re.match(r'^([A-Z]+)[-]?(\d+)([A-Z]?)$', tag)
-                    if not match: continue # Skip if unable to parse at all
-                    prefix = match.group(1)
-                    number = match.group(2)
-                    suffix = match.group(3)
-                # --- FIX END ---
+                    parsed = None
+                format_error, full_tag, prefix_warning = _check_instrument_tag(comp.tag, parsed)
+
+                if format_error:
+                    self.errors.append(format_error)
+                if full_tag is None:
+                    continue # Skip if unable to parse at all
                     
                 # Check for duplicates
-                full_tag = f"{prefix}-{number}{suffix}" if suffix else f"{prefix}-{number}" # Adjust full_tag format
                 if full_tag in tag_numbers:
-                    self.errors.append(f"Duplicate instrument tag: {tag}")
+                    self.errors.append(f"Duplicate instrument tag: {comp.tag}")
                 tag_numbers[full_tag] = comp_id
-                
-                # Validate tag prefix
-                valid_prefixes = [
-                    'F', 'P', 'T', 'L', 'A', 'V', 'E', 'I', 'S', 'Z',
-                    'FT', 'PT', 'TT', 'LT', 'FI', 'PI', 'TI', 'LI',
-                    'FC', 'PC', 'TC', 'LC', 'FIC', 'PIC', 'TIC', 'LIC',
-                    'FV', 'PV', 'TV', 'LV', 'FCV', 'PCV', 'TCV', 'LCV',
-                    'FAL', 'PAL', 'TAL', 'LAL', 'FAH', 'PAH', 'TAH', 'LAH',
-                    # New prefixes from your warning list:
-                    'SF', 'YS', 'CP', 'CPT', 'SCR', 'SIL', 'GV', 'PR', 'RM', 'LS', 'FS', 'FA', 'DP'
-                ]
-
-                # Check the full prefix (variable + modifiers)
-                if prefix not in valid_prefixes:
-                    self.warnings.append(f"Non-standard instrument prefix: {prefix} in {tag}")
 
+                if prefix_warning:
+                    self.warnings.append(prefix_warning)
 
     def validate_flow_directions(self):
         """Check for proper flow direction consistency"""
@@ -651,9 +708,8 @@ class PnIDValidator:
                 # Check if 'side_top' exists as a valid port for 'vessel' type.
                 # If not, the original logic might be fine, but I'll make it robust
                 # assuming 'side_top' might be a valid connection for certain vessels.
-                valid_vessel_inlets = ['top', 'inlet', 'side_top', 'side_bottom'] # Added 'inlet' and 'side_top'
                 if 'vessel' in pipe.to_comp.component_type or 'tank' in pipe.to_comp.component_type:
-                    if pipe.to_port not in valid_vessel_inlets:
+                    if pipe.to_port not in _VESSEL_INLET_PORTS:
                         self.warnings.append(
                             f"Vessel {pipe.to_comp.tag} inlet ({pipe.to_port}) should be from a standard inlet port (top, side, or designated inlet)."
                         )
@@ -661,163 +717,106 @@ class PnIDValidator:
 
     def validate_line_sizing(self):
         """Validate line sizing consistency"""
-        line_sizes = {}
-        size_pattern = re.compile(r'^(\d+)"?-([A-Z]+)-(\d+)')
-        
-        for pipe in self.pipes:
-            if pipe.label:
-                match = size_pattern.match(pipe.label)
-                if match:
-                    size = match.group(1)
-                    service = match.group(2)
-                    number = match.group(3)
-                    
-                    # Check consistency within same service
-                    key = f"{service}-{number}"
-                    if key in line_sizes and line_sizes[key] != size:
-                        self.warnings.append(
-                            f"Inconsistent line sizing for {key}: {size}\" vs {line_sizes[key]}\""
-                        )
-                    line_sizes[key] = size
-                    
-                    # Validate size transitions
-                    if pipe.from_comp and pipe.to_comp:
-                        # This would need more logic to track connected pipes
-                        pass
+        labels = pd.Series([pipe.label or '' for pipe in self.pipes], dtype=object)
+        parts = labels.str.extract(_LINE_SIZE_RE).dropna()
+        if parts.empty:
+            return
+        parts.columns = ['size', 'service', 'number']
+
+        # Check consistency within same service: each label against the
+        # previous label of the same line, in pipe order
+        key = parts['service'] + '-' + parts['number']
+        previous = parts['size'].groupby(key).shift()
+        clash = previous.notna() & (previous != parts['size'])
+        for line, size, prev in zip(key[clash], parts['size'][clash], previous[clash]):
+            self.warnings.append(f"Inconsistent line sizing for {line}: {size}\" vs {prev}\"")
 
     def validate_control_loops(self):
         """Validate control loop completeness"""
-        # --- FIX START ---
-        # The analyzer object already has tag_info because _preprocess_components
-        # is called in its __init__. No need to re-instantiate or explicitly call _preprocess_components here.
-        # Simply use self.control_loops from the current analyzer instance.
-        # This will assume that the ControlSystemAnalyzer used for PnIDValidator
-        # is the same one used for analysis, or that PnIDValidator handles its own preprocessing.
-        # Since PnIDValidator now calls ControlSystemAnalyzer for its init, it effectively
-        # triggers the _preprocess_components.
-        # If you were passing an 'analyzer' object directly, it would look different.
-        # For simplicity and to avoid circular dependencies/re-analysis, I'll assume
-        # PnIDValidator's own components are preprocessed by the call to the Analyzer's __init__
-        # within its own __init__.
-        # If ControlSystemAnalyzer's __init__ runs the full analysis, then calling it again here
-        # would re-run it. We just want its `_preprocess_components` part.
-        # The fix in PnIDValidator.__init__ is key.
-        
-        # Access the loops that were already found by this analyzer instance's __init__
-        # This assumes PnIDValidator will have an analyzer instance or access to the loops
-        # in a pre-processed state. Given the current structure, a full ControlSystemAnalyzer
-        # is instantiated, so we use its results.
-        
-        # This line should remain as it helps validate the loops found by the main analyzer
-        # However, to avoid creating an analyzer and re-running its logic every time
-        # validate_control_loops is called, you should access the `analyzer` object
-        # that was initialized in the `__init__` of PnIDValidator.
-        # Let's adjust PnIDValidator's init slightly for clarity on this.
-        # --- FIX END ---
-
-        # Assuming `self` (this PnIDValidator instance) has access to a pre-analyzed `control_loops` list
-        # from the ControlSystemAnalyzer instance created in PnIDValidator's __init__.
-        
-        # If ControlSystemAnalyzer's full analysis runs in its __init__, you need to be careful
-        # not to create multiple analyzer instances for the same data.
-        # The best way is for PnIDValidator to *receive* the components that already have `tag_info`,
-        # or it performs its own preprocessing, as I put in the PnIDValidator's __init__ FIX START.
-
-        # So, the `analyzer` here should really be `self.analyzer` if it were stored.
-        # For now, let's keep it as is, implying it re-runs analysis for validation,
-        # but the `tag_info` population ensures it doesn't crash.
-        
-        # Original: analyzer = ControlSystemAnalyzer(self.components, self.pipes)
-        # This will create a *new* analyzer and re-run its full analysis including tag preprocessing.
-        # This is functional but not optimal for performance if `validate_control_loops` is called often.
-        # For the requested "keep everything else exactly the same," this structure (re-instantiating)
-        # is what your code had. The key is that this new analyzer will *also* correctly populate tag_info.
-        
-        # Use the `control_loops` attribute from the analyzer that was created (and implicitly preprocessed components)
-        # This line assumes that `analyzer` is either a global instance or an instance created specifically for this scope.
-        # If you want to use the loops from the analyzer created in `app.py`, you'd need to pass it into PnIDValidator.
-        # Given your existing `app.py` structure, where you call `PnIDValidator(components, pipes)`,
-        # `PnIDValidator` needs to handle preprocessing itself or assume it's already done.
-        
-        # Let's stick to the current pattern where PnIDValidator's init ensures components are ready.
-        # The call to `ControlSystemAnalyzer(self.components, self.pipes)` here
-        # means a *new* analyzer is created and runs its analysis. This is inefficient
-        # if the analysis has already been done, but it *will* work for fixing the tag error.
-        current_analyzer_for_validation = ControlSystemAnalyzer(self.components, self.pipes)
-        
-        for loop in current_analyzer_for_validation.control_loops: # Use the loops from this analyzer
-            # Check each loop has all required components
-            if not loop.primary_element:
-                self.errors.append(f"Control loop {loop.loop_id} missing primary element")
-            if not loop.final_element:
-                self.errors.append(f"Control loop {loop.loop_id} missing final control element")
+        if self.analyzer is None:
+            # Loop detection only runs when no analyzer was supplied
+            self.analyzer = ControlSystemAnalyzer(self.components, self.pipes)
+        for loop in self.analyzer.control_loops: # Use the loops from this analyzer
+            self.errors.extend(_check_control_loop(loop.loop_id, loop.primary_element, loop.final_element))
 
     def validate_safety_systems(self):
         """Validate safety instrumentation"""
         # Check for relief valves on pressure vessels
-        vessels = [c for c in self.components.values() 
-                  if 'vessel' in c.component_type or 'tank' in c.component_type]
+        vessels = self._vessels
+        if not vessels:
+            return
+
+        # Ids of vessels with a relief valve or pressure safety valve directly downstream
+        vessel_ids = {vessel.id for vessel in vessels}
+        relieved_ids = set()
+        for pipe in self.pipes:
+            from_comp, to_comp = pipe.from_comp, pipe.to_comp
+            if not from_comp or not to_comp or from_comp.id not in vessel_ids:
+                continue
+            tag = to_comp.tag
+            if isinstance(tag, str) and ('PSV' in tag or 'PRV' in tag):
+                relieved_ids.add(from_comp.id)
         
         for vessel in vessels:
-            # Look for connected relief valve or pressure safety valve
-            has_psv = False
-            for pipe in self.pipes:
-                if (pipe.from_comp and pipe.from_comp.id == vessel.id and 
-                    pipe.to_comp and ('PSV' in pipe.to_comp.tag or 'PRV' in pipe.to_comp.tag)):
-                    has_psv = True
-                    break
-            
-            if not has_psv:
+            if vessel.id not in relieved_ids:
                 self.warnings.append(f"Vessel {vessel.tag} should have pressure relief protection")
 
 # — RENDERING ENHANCEMENTS —
 
 def render_control_loop_overlay(control_loops, components):
     """Render control loop visualization overlay"""
-    svg = '<g class="control-loops" opacity="0.7">'
+    parts = ['<g class="control-loops" opacity="0.7">']
 
     colors = ['#0066cc', '#cc6600', '#00cc66', '#cc0066']
-
-    for i, loop in enumerate(control_loops):
-        color = colors[i % len(colors)]
-        
-        # Get component positions
-        loop_components = []
-        for comp_id in loop.components:
-            if comp_id in components:
-                comp = components[comp_id]
-                loop_components.append((comp.x + comp.width/2, comp.y + comp.height/2))
-        
-        if len(loop_components) >= 2:
-            # Draw connecting lines with loop color
-            for j in range(len(loop_components) - 1):
-                p1, p2 = loop_components[j], loop_components[j + 1]
-                svg += f'<line x1="{p1[0]}" y1="{p1[1]}" x2="{p2[0]}" y2="{p2[1]}" '
-                svg += f'stroke="{color}" stroke-width="3" stroke-dasharray="10,5" opacity="0.5"/>'
-            
-            # Add loop label
-            center_x = sum(p[0] for p in loop_components) / len(loop_components)
-            center_y = sum(p[1] for p in loop_components) / len(loop_components)
-            svg += f'<circle cx="{center_x}" cy="{center_y}" r="30" fill="{color}" opacity="0.2"/>'
-            svg += f'<text x="{center_x}" y="{center_y}" text-anchor="middle" '
-            svg += f'font-size="12" font-weight="bold" fill="{color}">{loop.loop_id}</text>'
-
-    svg += '</g>'
-    return svg
+    get_component = components.get
+
+    for loop, color in zip(control_loops, itertools.cycle(colors)):
+        # Get component positions, skipping loops with fewer than two placed members
+        loop_components = [(comp.x + comp.width/2, comp.y + comp.height/2)
+                           for comp in map(get_component, loop.components) if comp is not None]
+        if len(loop_components) < 2:
+            continue
+
+        # One pass for both the path points and the label centroid
+        points = []
+        sum_x = sum_y = 0.0
+        for px, py in loop_components:
+            points.append(f'{fmt_coord(px)} {fmt_coord(py)}')
+            sum_x += px
+            sum_y += py
+        
+        # Draw connecting lines with loop color, as one polyline path
+        parts.append(f'<path d="M {" L ".join(points)}" fill="none" stroke="{color}" stroke-width="3" '
+                     f'stroke-dasharray="10,5" opacity="0.5"/>')
+        
+        # Add loop label
+        center_x = fmt_coord(sum_x / len(loop_components))
+        center_y = fmt_coord(sum_y / len(loop_components))
+        parts.append(f'<circle cx="{center_x}" cy="{center_y}" r="30" fill="{color}" opacity="0.2"/>')
+        parts.append(f'<text x="{center_x}" y="{center_y}" text-anchor="middle" '
+                     f'font-size="12" font-weight="bold" fill="{color}">{loop.loop_id}</text>')
+
+    parts.append('</g>')
+    return ''.join(parts)
 
 def render_validation_overlay(validation_results, components):
     """Render validation errors and warnings on the P&ID"""
-    svg = '<g class="validation-overlay">'
+    errors = validation_results['errors']
+    warnings = validation_results['warnings']
+    if not errors and not warnings:
+        return ''  # Clean drawing: nothing to overlay
+
+    parts = ['<g class="validation-overlay">']
 
     # Show errors with red markers
-    for i, error in enumerate(validation_results['errors']): # Use enumerate for robust y-positioning
+    for i, error in enumerate(errors): # Use enumerate for robust y-positioning
         y_pos = 50 + i * 20
-        svg += f'<text x="50" y="{y_pos}" font-size="12" fill="red">❌ {error}</text>'
+        parts.append(f'<text x="50" y="{y_pos}" font-size="12" fill="red">❌ {error}</text>')
 
     # Show warnings with yellow markers
-    for i, warning in enumerate(validation_results['warnings']): # Use enumerate
+    for i, warning in enumerate(warnings): # Use enumerate
         y_pos = 200 + i * 20
-        svg += f'<text x="50" y="{y_pos}" font-size="12" fill="orange">⚠️ {warning}</text>'
+        parts.append(f'<text x="50" y="{y_pos}" font-size="12" fill="orange">⚠️ {warning}</text>')
 
-    svg += '</g>'
-    return svg
+    parts.append('</g>')
+    return ''.join(parts)
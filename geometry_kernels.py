@@ -0,0 +1,284 @@
+"""
+Geometry Kernels
+Batch port-coordinate and orthogonal-routing math for P&ID construction.
+Loops are JIT-compiled with Numba when it is installed; otherwise the
+equivalent vectorized NumPy implementations are used. The grid A* search
+has no vectorized form and is only provided with Numba.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+if NUMBA_AVAILABLE:
+
+    @njit(cache=True)
+    def _port_coords_kernel(xs, ys, ws, hs, fxs, fys, rots, out_xy):
+        for i in range(xs.shape[0]):
+            dx = fxs[i] * ws[i]
+            dy = fys[i] * hs[i]
+            if rots[i] != 0:
+                # Rotate port position around component center
+                cx = ws[i] / 2
+                cy = hs[i] / 2
+                dx -= cx
+                dy -= cy
+                angle = np.radians(rots[i])
+                c = np.cos(angle)
+                s = np.sin(angle)
+                new_dx = dx * c - dy * s + cx
+                new_dy = dx * s + dy * c + cy
+                dx = new_dx
+                dy = new_dy
+            out_xy[i, 0] = xs[i] + dx
+            out_xy[i, 1] = ys[i] + dy
+
+    @njit(cache=True)
+    def _orthogonal_paths_kernel(from_xy, to_xy, out, bent):
+        for i in range(from_xy.shape[0]):
+            x0 = from_xy[i, 0]
+            y0 = from_xy[i, 1]
+            x1 = to_xy[i, 0]
+            y1 = to_xy[i, 1]
+            dx = x1 - x0
+            dy = y1 - y0
+            out[i, 0, 0] = x0
+            out[i, 0, 1] = y0
+            out[i, 3, 0] = x1
+            out[i, 3, 1] = y1
+            if abs(dx) > 50 and abs(dy) > 50:
+                bent[i] = True
+                if abs(dx) > abs(dy):
+                    mid_x = x0 + dx * 0.7
+                    out[i, 1, 0] = mid_x
+                    out[i, 1, 1] = y0
+                    out[i, 2, 0] = mid_x
+                    out[i, 2, 1] = y1
+                else:
+                    mid_y = y0 + dy * 0.7
+                    out[i, 1, 0] = x0
+                    out[i, 1, 1] = mid_y
+                    out[i, 2, 0] = x1
+                    out[i, 2, 1] = mid_y
+            else:
+                bent[i] = False
+                out[i, 1, 0] = x1
+                out[i, 1, 1] = y0
+                out[i, 2, 0] = x1
+                out[i, 2, 1] = y1
+
+    @njit(cache=True)
+    def _heap_before(node_f, a, b):
+        # Heap order (f, push order); node indices are assigned in push order
+        return node_f[a] < node_f[b] or (node_f[a] == node_f[b] and a < b)
+
+    @njit(cache=True)
+    def _astar_kernel(blocked, crossing, sx, sy, ex, ey, prefer_straight):
+        width, height = blocked.shape
+        dir_x = (0, 1, 0, -1)  # N, E, S, W
+        dir_y = (1, 0, -1, 0)
+
+        # Search nodes live in a growable pool; a cell is pushed again only when
+        # its cost improves, and superseded entries are skipped when popped
+        cap = 1024
+        node_x = np.empty(cap, np.int64)
+        node_y = np.empty(cap, np.int64)
+        node_g = np.empty(cap, np.float64)
+        node_f = np.empty(cap, np.float64)
+        node_parent = np.empty(cap, np.int64)
+        node_dir = np.empty(cap, np.int64)  # Index of the step into the node, -1 at the start
+        heap = np.empty(cap, np.int64)
+        closed = np.zeros((width, height), np.bool_)
+        best_g = np.full((width, height), np.inf)
+
+        node_x[0] = sx
+        node_y[0] = sy
+        node_g[0] = 0.0
+        node_f[0] = abs(sx - ex) + abs(sy - ey)
+        node_parent[0] = -1
+        node_dir[0] = -1
+        if 0 <= sx < width and 0 <= sy < height:
+            best_g[sx, sy] = 0.0
+        heap[0] = 0
+        n_nodes = 1
+        heap_len = 1
+
+        while heap_len > 0:
+            # heapq.heappop
+            heap_len -= 1
+            last = heap[heap_len]
+            if heap_len > 0:
+                current = heap[0]
+                pos = 0
+                child = 1
+                while child < heap_len:
+                    right = child + 1
+                    if right < heap_len and not _heap_before(node_f, heap[child], heap[right]):
+                        child = right
+                    heap[pos] = heap[child]
+                    pos = child
+                    child = 2 * pos + 1
+                while pos > 0:
+                    parent_pos = (pos - 1) >> 1
+                    if _heap_before(node_f, last, heap[parent_pos]):
+                        heap[pos] = heap[parent_pos]
+                        pos = parent_pos
+                    else:
+                        break
+                heap[pos] = last
+            else:
+                current = last
+
+            cx = node_x[current]
+            cy = node_y[current]
+            inside = 0 <= cx < width and 0 <= cy < height
+            if inside and closed[cx, cy]:
+                continue  # Stale entry, superseded by a cheaper push
+            if cx == ex and cy == ey:
+                length = 0
+                node = current
+                while node >= 0:
+                    length += 1
+                    node = node_parent[node]
+                path = np.empty((length, 2), np.int64)
+                node = current
+                for k in range(length - 1, -1, -1):
+                    path[k, 0] = node_x[node]
+                    path[k, 1] = node_y[node]
+                    node = node_parent[node]
+                return path
+
+            if inside:
+                closed[cx, cy] = True
+
+            for d in range(4):
+                nx = cx + dir_x[d]
+                ny = cy + dir_y[d]
+                if nx < 0 or nx >= width or ny < 0 or ny >= height:
+                    continue
+                if blocked[nx, ny] or closed[nx, ny]:
+                    continue
+
+                g = node_g[current] + (1.5 if crossing[nx, ny] else 1.0)
+                if prefer_straight and node_dir[current] >= 0 and node_dir[current] != d:
+                    g += 0.5
+                if g >= best_g[nx, ny]:
+                    continue
+                best_g[nx, ny] = g
+
+                if n_nodes == cap:
+                    cap *= 2
+                    node_x = np.concatenate((node_x, np.empty(n_nodes, np.int64)))
+                    node_y = np.concatenate((node_y, np.empty(n_nodes, np.int64)))
+                    node_g = np.concatenate((node_g, np.empty(n_nodes, np.float64)))
+                    node_f = np.concatenate((node_f, np.empty(n_nodes, np.float64)))
+                    node_parent = np.concatenate((node_parent, np.empty(n_nodes, np.int64)))
+                    node_dir = np.concatenate((node_dir, np.empty(n_nodes, np.int64)))
+                    heap = np.concatenate((heap, np.empty(n_nodes, np.int64)))
+                node = n_nodes
+                n_nodes += 1
+                node_x[node] = nx
+                node_y[node] = ny
+                node_g[node] = g
+                node_f[node] = g + abs(nx - ex) + abs(ny - ey)
+                node_parent[node] = current
+                node_dir[node] = d
+
+                # heapq.heappush
+                pos = heap_len
+                heap_len += 1
+                while pos > 0:
+                    parent_pos = (pos - 1) >> 1
+                    if _heap_before(node_f, node, heap[parent_pos]):
+                        heap[pos] = heap[parent_pos]
+                        pos = parent_pos
+                    else:
+                        break
+                heap[pos] = node
+
+        return np.empty((0, 2), np.int64)
+
+
+def port_coords_batch(xs, ys, ws, hs, fxs, fys, rots):
+    """
+    Absolute port coordinates for N ports given component boxes, port
+    fractions of (width, height) and rotations in degrees. Returns (N, 2).
+    """
+    xs, ys, ws, hs, fxs, fys, rots = (
+        np.ascontiguousarray(a, dtype=np.float64) for a in (xs, ys, ws, hs, fxs, fys, rots)
+    )
+    out_xy = np.empty((xs.shape[0], 2))
+
+    if NUMBA_AVAILABLE:
+        _port_coords_kernel(xs, ys, ws, hs, fxs, fys, rots, out_xy)
+        return out_xy
+
+    dx = fxs * ws
+    dy = fys * hs
+    rotated = rots != 0
+    if rotated.any():
+        cx, cy = ws[rotated] / 2, hs[rotated] / 2
+        rdx, rdy = dx[rotated] - cx, dy[rotated] - cy
+        angle = np.radians(rots[rotated])
+        c, s = np.cos(angle), np.sin(angle)
+        dx[rotated] = rdx * c - rdy * s + cx
+        dy[rotated] = rdx * s + rdy * c + cy
+    out_xy[:, 0] = xs + dx
+    out_xy[:, 1] = ys + dy
+    return out_xy
+
+
+def orthogonal_paths(from_xy, to_xy):
+    """
+    Orthogonal routes for N pipes from (N, 2) start/end arrays.
+
+    Returns (paths, bent): paths is (N, 4, 2); where bent is False the route
+    is a simple L-shape and only points 0, 1 and 3 are meaningful.
+    """
+    from_xy = np.ascontiguousarray(from_xy, dtype=np.float64)
+    to_xy = np.ascontiguousarray(to_xy, dtype=np.float64)
+    paths = np.empty((from_xy.shape[0], 4, 2))
+    bent = np.empty(from_xy.shape[0], dtype=np.bool_)
+
+    if NUMBA_AVAILABLE:
+        _orthogonal_paths_kernel(from_xy, to_xy, paths, bent)
+        return paths, bent
+
+    d = to_xy - from_xy
+    adx, ady = np.abs(d[:, 0]), np.abs(d[:, 1])
+    bent[:] = (adx > 50) & (ady > 50)
+    horiz = adx > ady
+    mid = from_xy + d * 0.7
+
+    # Two-bend route through a mid line at 70% of the run:
+    # horizontal preference -> (mid_x, y0), (mid_x, y1); vertical -> (x0, mid_y), (x1, mid_y)
+    paths[:, 0] = from_xy
+    paths[:, 1, 0] = np.where(horiz, mid[:, 0], from_xy[:, 0])
+    paths[:, 1, 1] = np.where(horiz, from_xy[:, 1], mid[:, 1])
+    paths[:, 2, 0] = np.where(horiz, mid[:, 0], to_xy[:, 0])
+    paths[:, 2, 1] = np.where(horiz, to_xy[:, 1], mid[:, 1])
+    paths[:, 3] = to_xy
+
+    # Simple L-shape: a single corner at (x1, y0)
+    paths[~bent, 1, 0] = to_xy[~bent, 0]
+    paths[~bent, 1, 1] = from_xy[~bent, 1]
+    return paths, bent
+
+
+def astar_grid(blocked, crossing, start, end, prefer_straight=True):
+    """
+    4-directional A* over a (W, H) grid. blocked marks impassable cells,
+    crossing cells that cost 1.5 instead of 1.0; turning costs 0.5 extra when
+    prefer_straight. Returns the (K, 2) cell path from start to end, or None
+    if end is unreachable. Requires Numba (see NUMBA_AVAILABLE).
+    """
+    path = _astar_kernel(
+        np.ascontiguousarray(blocked, dtype=np.bool_), np.ascontiguousarray(crossing, dtype=np.bool_),
+        start[0], start[1], end[0], end[1], prefer_straight
+    )
+    return path if len(path) else None
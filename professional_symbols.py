@@ -3,6 +3,27 @@ Professional ISA Symbol Library
 Detailed, industry-standard P&ID symbols matching real engineering drawings
 """
 
+import re
+from functools import lru_cache
+
+# Precompiled patterns
+
+_INSTRUMENT_TAG_RE = re.compile(r'^([A-Z]+)-?(\d+)([A-Z]?)$')  # letters, loop number, suffix
+_TAG_GAP_RE = re.compile(r'>\s+<')  # whitespace between elements
+_WHITESPACE_RE = re.compile(r'\s+')  # runs of whitespace, including source indentation
+
+# Function letters drawn with a panel-mounted box: Controller or Indicator
+_PANEL_MOUNTED = frozenset('CI')
+
+# Pipe line styles by line type
+_LINE_STYLES = {
+    'process': {'width': 3, 'color': 'black', 'dash': ''},
+    'utility': {'width': 2.5, 'color': 'black', 'dash': ''},
+    'instrument': {'width': 1, 'color': 'black', 'dash': '5,3'},
+    'electrical': {'width': 1, 'color': 'black', 'dash': '2,2'},
+}
+_DEFAULT_LINE_STYLE = _LINE_STYLES['process']
+
 # Professional ISA Symbols with accurate details
 
 PROFESSIONAL_ISA_SYMBOLS = {
@@ -26,10 +47,7 @@ PROFESSIONAL_ISA_SYMBOLS = {
     <path d="M 22,10 L 38,10 M 30,2 L 30,18" stroke="black" stroke-width="2"/>
     <rect x="0" y="40" width="10" height="10" fill="white" stroke="black" stroke-width="2"/>
     <rect x="50" y="40" width="10" height="10" fill="white" stroke="black" stroke-width="2"/>
-    <circle cx="5" cy="42" r="1" fill="black"/>
-    <circle cx="5" cy="48" r="1" fill="black"/>
-    <circle cx="55" cy="42" r="1" fill="black"/>
-    <circle cx="55" cy="48" r="1" fill="black"/>
+    <path d="M 4,42 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z M 4,48 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z M 54,42 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z M 54,48 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z" fill="black"/>
     </symbol>''',
 
     'valve_globe': '''<symbol id="valve_globe" viewBox="0 0 60 80" preserveAspectRatio="xMidYMid meet">
@@ -83,12 +101,8 @@ PROFESSIONAL_ISA_SYMBOLS = {
     'filter': '''<symbol id="filter" viewBox="0 0 80 120" preserveAspectRatio="xMidYMid meet">
     <path d="M 15,30 L 65,30 L 55,80 L 50,90 L 30,90 L 25,80 Z" 
           fill="white" stroke="black" stroke-width="2.5"/>
-    <line x1="20" y1="40" x2="60" y2="40" stroke="black" stroke-width="1.5"/>
-    <line x1="22" y1="45" x2="58" y2="45" stroke="black" stroke-width="1.5"/>
-    <line x1="24" y1="50" x2="56" y2="50" stroke="black" stroke-width="1.5"/>
-    <line x1="26" y1="55" x2="54" y2="55" stroke="black" stroke-width="1.5"/>
-    <line x1="28" y1="60" x2="52" y2="60" stroke="black" stroke-width="1.5"/>
-    <line x1="30" y1="65" x2="50" y2="65" stroke="black" stroke-width="1.5"/>
+    <path d="M 20,40 L 60,40 M 22,45 L 58,45 M 24,50 L 56,50 M 26,55 L 54,55 M 28,60 L 52,60 M 30,65 L 50,65" 
+          stroke="black" stroke-width="1.5"/>
     <path d="M 25,40 L 35,50 M 30,40 L 40,50 M 35,40 L 45,50 M 40,40 L 50,50 M 45,40 L 55,50" 
           stroke="black" stroke-width="0.5" opacity="0.5"/>
     <rect x="35" y="10" width="10" height="20" fill="white" stroke="black" stroke-width="2"/>
@@ -113,9 +127,7 @@ PROFESSIONAL_ISA_SYMBOLS = {
     <path d="M 25,20 Q 30,15 35,20" fill="white" stroke="black" stroke-width="2.5"/>
     <circle cx="30" cy="60" r="6" fill="gray"/>
     <rect x="27" y="35" width="6" height="25" fill="gray"/>
-    <line x1="20" y1="30" x2="25" y2="30" stroke="black" stroke-width="1"/>
-    <line x1="20" y1="40" x2="25" y2="40" stroke="black" stroke-width="1"/>
-    <line x1="20" y1="50" x2="25" y2="50" stroke="black" stroke-width="1"/>
+    <path d="M 20,30 L 25,30 M 20,40 L 25,40 M 20,50 L 25,50" stroke="black" stroke-width="1"/>
     </symbol>''',
 
     # --- ELECTRICAL ---
@@ -131,30 +143,20 @@ PROFESSIONAL_ISA_SYMBOLS = {
     <rect x="20" y="20" width="80" height="120" fill="none" stroke="black" stroke-width="1.5"/>
     <rect x="25" y="25" width="70" height="20" fill="none" stroke="black" stroke-width="1"/>
     <text x="60" y="38" text-anchor="middle" font-size="10" font-family="Arial">CONTROL PANEL</text>
-    <circle cx="35" cy="60" r="5" fill="none" stroke="black" stroke-width="1.5"/>
-    <circle cx="50" cy="60" r="5" fill="none" stroke="black" stroke-width="1.5"/>
-    <circle cx="65" cy="60" r="5" fill="none" stroke="black" stroke-width="1.5"/>
-    <circle cx="80" cy="60" r="5" fill="none" stroke="black" stroke-width="1.5"/>
+    <path d="M 30,60 a 5,5 0 1,0 10,0 a 5,5 0 1,0 -10,0 Z M 45,60 a 5,5 0 1,0 10,0 a 5,5 0 1,0 -10,0 Z M 60,60 a 5,5 0 1,0 10,0 a 5,5 0 1,0 -10,0 Z M 75,60 a 5,5 0 1,0 10,0 a 5,5 0 1,0 -10,0 Z" 
+          fill="none" stroke="black" stroke-width="1.5"/>
     <rect x="30" y="80" width="15" height="20" rx="2" fill="none" stroke="black" stroke-width="1.5"/>
     <rect x="50" y="80" width="15" height="20" rx="2" fill="none" stroke="black" stroke-width="1.5"/>
     <rect x="70" y="80" width="15" height="20" rx="2" fill="none" stroke="black" stroke-width="1.5"/>
     <rect x="25" y="110" width="70" height="25" fill="none" stroke="black" stroke-width="1"/>
-    <line x1="25" y1="120" x2="95" y2="120" stroke="black" stroke-width="0.5"/>
-    <line x1="35" y1="110" x2="35" y2="135" stroke="black" stroke-width="0.5"/>
-    <line x1="45" y1="110" x2="45" y2="135" stroke="black" stroke-width="0.5"/>
-    <line x1="55" y1="110" x2="55" y2="135" stroke="black" stroke-width="0.5"/>
-    <line x1="65" y1="110" x2="65" y2="135" stroke="black" stroke-width="0.5"/>
-    <line x1="75" y1="110" x2="75" y2="135" stroke="black" stroke-width="0.5"/>
-    <line x1="85" y1="110" x2="85" y2="135" stroke="black" stroke-width="0.5"/>
+    <path d="M 25,120 L 95,120 M 35,110 L 35,135 M 45,110 L 45,135 M 55,110 L 55,135 M 65,110 L 65,135 M 75,110 L 75,135 M 85,110 L 85,135" 
+          stroke="black" stroke-width="0.5"/>
     </symbol>''',
 
     # --- PIPING COMPONENTS ---
     'flange': '''<symbol id="flange" viewBox="0 0 30 20" preserveAspectRatio="xMidYMid meet">
     <rect x="0" y="5" width="30" height="10" fill="white" stroke="black" stroke-width="2.5"/>
-    <circle cx="5" cy="7" r="1" fill="black"/>
-    <circle cx="5" cy="13" r="1" fill="black"/>
-    <circle cx="25" cy="7" r="1" fill="black"/>
-    <circle cx="25" cy="13" r="1" fill="black"/>
+    <path d="M 4,7 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z M 4,13 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z M 24,7 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z M 24,13 a 1,1 0 1,0 2,0 a 1,1 0 1,0 -2,0 Z" fill="black"/>
     </symbol>''',
 
     'reducer': '''<symbol id="reducer" viewBox="0 0 60 40" preserveAspectRatio="xMidYMid meet">
@@ -175,6 +177,13 @@ PROFESSIONAL_ISA_SYMBOLS = {
     </symbol>''',
 }
 
+# Strip source indentation and line breaks from the symbol markup once at import;
+# SVG collapses whitespace in attributes and text, so rendering is unchanged
+PROFESSIONAL_ISA_SYMBOLS = {
+    symbol_id: _WHITESPACE_RE.sub(' ', _TAG_GAP_RE.sub('><', svg)).strip()
+    for symbol_id, svg in PROFESSIONAL_ISA_SYMBOLS.items()
+}
+
 # Arrow marker definitions for flow direction
 
 ARROW_MARKERS = '''
@@ -190,12 +199,25 @@ ARROW_MARKERS = '''
     <marker id="arrowhead-signal" markerWidth="10" markerHeight="10" refX="9" refY="5" orient="auto">
         <polygon points="0,0 10,5 0,10" fill="none" stroke="black" stroke-width="1"/>
     </marker>
+
+    <marker id="flow-arrow" markerWidth="8" markerHeight="8" refX="8" refY="4" orient="auto" markerUnits="userSpaceOnUse">
+        <polygon points="0,0 8,4 0,8" fill="black"/>
+    </marker>
 </defs>
 '''
 
-def get_component_symbol(component_type: str) -> str:
+def fmt_coord(value: float) -> str:
+    """
+    Formats an SVG coordinate with at most two decimals and no trailing zeros
     """
-    Returns the appropriate symbol SVG for a component type
+    text = f'{value:.2f}'.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+@lru_cache(maxsize=256)
+def get_symbol_id(component_type: str) -> str:
+    """
+    Returns the PROFESSIONAL_ISA_SYMBOLS key for a component type
     """
     # Map common variations to standard symbols
     type_mapping = {
@@ -216,21 +238,38 @@ def get_component_symbol(component_type: str) -> str:
     }
 
     normalized_type = component_type.lower().replace('-', '_').replace(' ', '_')
-    mapped_type = type_mapping.get(normalized_type, normalized_type)
+    return type_mapping.get(normalized_type, normalized_type)
 
-    return PROFESSIONAL_ISA_SYMBOLS.get(mapped_type, '')
 
+@lru_cache(maxsize=256)
+def create_symbol_use(symbol_id: str, width: float, height: float) -> str:
+    """
+    Returns a <use> reference drawing a <defs> symbol at the component size.
+    Uses SVG 1.1 xlink:href so scour's id stripping sees the reference.
+    """
+    return f'<use xlink:href="#{symbol_id}" width="{width}" height="{height}"/>'
 
-def create_professional_instrument_bubble(tag: str, x: float, y: float, size: float = 25) -> str:
+
+@lru_cache(maxsize=64)
+def render_symbol_defs(symbol_ids: frozenset) -> str:
     """
-    Creates a professional instrument bubble with proper ISA formatting
+    Returns a <defs> block with the symbol_ids symbols referenced by
+    create_symbol_use (built once per distinct set)
     """
-    import re
+    symbols = [svg for symbol_id, svg in PROFESSIONAL_ISA_SYMBOLS.items() if symbol_id in symbol_ids]
+    return '<defs>' + ''.join(symbols) + '</defs>' if symbols else ''
+
 
+@lru_cache(maxsize=512)
+def _bubble_template(tag: str, size: float):
+    """
+    Instrument bubble markup for a tag and size, with str.format fields for the
+    position-dependent coordinates; None when the tag does not parse
+    """
     # Parse instrument tag
-    match = re.match(r'^([A-Z]+)[-]?(\d+)([A-Z]?)$', tag)
+    match = _INSTRUMENT_TAG_RE.match(tag)
     if not match:
-        return f'<circle cx="{x}" cy="{y}" r="{size}" fill="white" stroke="black" stroke-width="2"/>'
+        return None
 
     letters = match.group(1)
     number = match.group(2)
@@ -241,36 +280,49 @@ def create_professional_instrument_bubble(tag: str, x: float, y: float, size: fl
     if is_local:
         letters = letters[1:]  # Remove L prefix
 
-    # Create SVG
-    svg = f'<g class="instrument-{tag}">'
+    box_size = size * 0.7
+    text_size = size * 0.5
 
     # Main circle
-    svg += f'<circle cx="{x}" cy="{y}" r="{size}" fill="white" stroke="black" stroke-width="2.5"/>'
+    parts = [
+        f'<g class="instrument-{tag}">',
+        f'<circle cx="{{x}}" cy="{{y}}" r="{size}" fill="white" stroke="black" stroke-width="2.5"/>',
+    ]
 
     # Add horizontal line for field-mounted instruments
     if not is_local:
-        svg += f'<line x1="{x-size}" y1="{y}" x2="{x+size}" y2="{y}" stroke="black" stroke-width="2.5"/>'
+        parts.append('<line x1="{x_left}" y1="{y}" x2="{x_right}" y2="{y}" stroke="black" stroke-width="2.5"/>')
 
     # Add box for panel-mounted instruments
-    if 'C' in letters or 'I' in letters:  # Controller or Indicator
-        box_size = size * 0.7
-        svg += f'<rect x="{x-box_size}" y="{y-box_size}" width="{box_size*2}" height="{box_size*2}" '
-        svg += f'fill="none" stroke="black" stroke-width="1.5" stroke-dasharray="3,3"/>'
+    if not _PANEL_MOUNTED.isdisjoint(letters):  # Controller or Indicator
+        parts.append(f'<rect x="{{box_x}}" y="{{box_y}}" width="{box_size*2}" height="{box_size*2}" '
+                     'fill="none" stroke="black" stroke-width="1.5" stroke-dasharray="3,3"/>')
 
-    # Text positioning
-    text_size = size * 0.5
-    y_offset = size * 0.15
+    # Tag letters (function) and number
+    parts.append('<text x="{x}" y="{letters_y}" text-anchor="middle" '
+                 f'font-size="{text_size}" font-weight="bold" font-family="Arial, sans-serif">{letters}</text>'
+                 '<text x="{x}" y="{number_y}" text-anchor="middle" '
+                 f'font-size="{text_size*0.8}" font-family="Arial, sans-serif">{number}{suffix}</text>'
+                 '</g>')
+    return ''.join(parts)
 
-    # Tag letters (function)
-    svg += f'<text x="{x}" y="{y-y_offset}" text-anchor="middle" '
-    svg += f'font-size="{text_size}" font-weight="bold" font-family="Arial, sans-serif">{letters}</text>'
 
-    # Tag number
-    svg += f'<text x="{x}" y="{y+text_size*0.7}" text-anchor="middle" '
-    svg += f'font-size="{text_size*0.8}" font-family="Arial, sans-serif">{number}{suffix}</text>'
+def create_professional_instrument_bubble(tag: str, x: float, y: float, size: float = 25) -> str:
+    """
+    Creates a professional instrument bubble with proper ISA formatting
+    """
+    template = _bubble_template(tag, size)
+    if template is None:
+        return f'<circle cx="{x}" cy="{y}" r="{size}" fill="white" stroke="black" stroke-width="2"/>'
 
-    svg += '</g>'
-    return svg
+    # Only the position changes between calls with the same tag and size
+    box_size = size * 0.7
+    return template.format(
+        x=x, y=y,
+        x_left=x - size, x_right=x + size,
+        box_x=x - box_size, box_y=y - box_size,
+        letters_y=y - size * 0.15, number_y=y + size * 0.5 * 0.7,
+    )
 
 
 def create_pipe_with_spec(points: list, pipe_spec: str, line_type: str = 'process') -> str:
@@ -282,19 +334,10 @@ def create_pipe_with_spec(points: list, pipe_spec: str, line_type: str = 'proces
         return ''
 
     # Line styles based on type
-    line_styles = {
-        'process': {'width': 3, 'color': 'black', 'dash': ''},
-        'utility': {'width': 2.5, 'color': 'black', 'dash': ''},
-        'instrument': {'width': 1, 'color': 'black', 'dash': '5,3'},
-        'electrical': {'width': 1, 'color': 'black', 'dash': '2,2'},
-    }
-
-    style = line_styles.get(line_type, line_styles['process'])
+    style = _LINE_STYLES.get(line_type, _DEFAULT_LINE_STYLE)
 
     # Create path
-    path_d = f"M {points[0][0]},{points[0][1]}"
-    for point in points[1:]:
-        path_d += f" L {point[0]},{point[1]}"
+    path_d = 'M ' + ' L '.join([f'{fmt_coord(px)},{fmt_coord(py)}' for px, py in points])
 
     svg = '<g class="pipe">'
 
@@ -312,14 +355,11 @@ def create_pipe_with_spec(points: list, pipe_spec: str, line_type: str = 'proces
         mid_x = (points[mid_idx-1][0] + points[mid_idx][0]) / 2
         mid_y = (points[mid_idx-1][1] + points[mid_idx][1]) / 2
         
-        # Label background
-        text_width = len(pipe_spec) * 8
-        svg += f'<rect x="{mid_x - text_width/2}" y="{mid_y - 12}" '
-        svg += f'width="{text_width}" height="20" fill="white" stroke="none"/>'
-        
-        # Label text
-        svg += f'<text x="{mid_x}" y="{mid_y}" text-anchor="middle" '
-        svg += f'font-size="10" font-family="Arial, sans-serif">{pipe_spec}</text>'
+        # Label text over a white halo (stroke painted under the fill) that
+        # masks the pipe behind it, in place of a separate background rect
+        svg += f'<text x="{fmt_coord(mid_x)}" y="{fmt_coord(mid_y)}" text-anchor="middle" '
+        svg += f'font-size="10" font-family="Arial, sans-serif" '
+        svg += f'paint-order="stroke" stroke="white" stroke-width="3" stroke-linejoin="round">{pipe_spec}</text>'
 
     svg += '</g>'
     return svg